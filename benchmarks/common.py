@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+"""Shared helpers for the benchmark scripts."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from taptimise.ingest import load_village  # noqa: E402
+
+TEST_DIR = os.path.join(os.path.dirname(__file__), "..", "test")
+
+
+def load(name):
+    # reads a village from the test directory into local x, y coordinates
+    raw_houses, _, _ = load_village(os.path.join(TEST_DIR, name))
+
+    return raw_houses
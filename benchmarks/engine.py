@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Times one Monte-Carlo step of the object and numpy energy engines.
+
+Builds random villages of each (houses, taps) size in SIZES, attaches the
+houses to random taps with full buffers and times REPEATS sweeps of each
+engine from the same state. Reports the fastest seconds per MCS and the speed
+up of numpy over object.
+Usage: python benchmarks/engine.py
+"""
+
+import random
+import time
+
+import common  # noqa: F401, puts taptimise on the path
+
+from taptimise.classes import Tap, House
+from taptimise.vectorised import HouseArrays, ArrayTap
+from taptimise.optimise import randomise, sweep, BUFFER_MULTIPLYER
+
+SIZES = [(1000, 100), (5000, 500), (5000, 100), (20000, 700)]
+REPEATS = 5
+SIDE = 5000  # metres
+
+
+def per_step(num_houses, num_taps, engine):
+    # fastest of REPEATS sweeps, in seconds
+    rng = random.Random(0)
+    buff_size = num_taps * BUFFER_MULTIPLYER
+
+    houses = [
+        House(rng.uniform(0, SIDE), rng.uniform(0, SIDE), 1, buff_size, -1)
+        for _ in range(num_houses)
+    ]
+    exp_load = num_houses / num_taps
+
+    if engine == "numpy":
+        arrays = HouseArrays(houses)
+        taps = [ArrayTap(exp_load, arrays, i) for i in range(num_taps)]
+    else:
+        taps = [Tap(exp_load, i) for i in range(num_taps)]
+
+    for h in houses:
+        for _ in range(buff_size):
+            h.buff.insert(taps[rng.randrange(num_taps)])
+
+    randomise(houses, taps, rng)
+
+    for t in taps:
+        t.centralise()
+        t.score()
+
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        tic = time.perf_counter()
+        sweep(houses, taps, 0, [0, 0, 0], rng)
+        best = min(best, time.perf_counter() - tic)
+
+    return best
+
+
+def main():
+    Tap.BASE = 50
+
+    print(
+        f"{'houses':>7} {'taps':>5} {'object':>8} {'numpy':>8} {'speed up':>8}"
+    )
+
+    for num_houses, num_taps in SIZES:
+        obj = per_step(num_houses, num_taps, "object")
+        vec = per_step(num_houses, num_taps, "numpy")
+
+        print(
+            f"{num_houses:>7} {num_taps:>5} {obj:>8.3f} {vec:>8.3f} "
+            f"{obj / vec:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+"""Times reading a large village with the old row loop and read_houses.
+
+Writes a synthetic village of HOUSES rows (with a few unreadable rows) to a
+temporary file, reads it with the original per row parse and per house
+coordinate transform, then with read_houses and one vectorised transform,
+and checks both give the same local coordinates.
+Usage: python benchmarks/ingest.py [houses]
+"""
+
+import csv
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import TEST_DIR  # noqa: F401 (puts taptimise on the path)
+
+from taptimise.ingest import read_houses
+from taptimise.units import LocalXY
+
+HOUSES = 100_000
+BAD_EVERY = 10_000
+
+
+def write_village(path, n, rng):
+    lat = 7.89 + 0.05 * rng.random(n)
+    lon = -11.9 + 0.05 * rng.random(n)
+    demand = rng.integers(50, 500, n)
+
+    with open(path, "w") as f:
+        for i in range(n):
+            if i % BAD_EVERY == BAD_EVERY - 1:
+                print("lat,lon,demand", file=f)
+
+            print(f"{lat[i]:.9f},{lon[i]:.9f},{demand[i]}", file=f)
+
+
+def looped(path):
+    raw_houses = []
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        for row in csv.reader(f):
+            try:
+                raw_houses.append([float(elem) for elem in row])
+            except ValueError:
+                pass
+
+    convert = LocalXY(*raw_houses[0][0:2])
+
+    for h in raw_houses:
+        h[0], h[1] = convert.geo2enu(h[0], h[1])
+
+    return np.array(raw_houses)
+
+
+def vectorised(path):
+    raw_houses, bad = read_houses(path)
+
+    convert = LocalXY(*raw_houses[0, 0:2])
+
+    raw_houses[:, 0], raw_houses[:, 1] = convert.geo2enu(
+        raw_houses[:, 0], raw_houses[:, 1]
+    )
+
+    return raw_houses, bad
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else HOUSES
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "village.csv")
+        write_village(path, n, np.random.default_rng(0))
+
+        tic = time.perf_counter()
+        old = looped(path)
+        old_time = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        new, bad = vectorised(path)
+        new_time = time.perf_counter() - tic
+
+    error = np.abs(old - new).max()
+
+    print(f"houses: {len(new)}, unreadable rows: {bad}")
+    print(f"row loop:   {old_time:.3f} s")
+    print(f"vectorised: {new_time:.3f} s")
+    print(f"max difference: {error:.2g} m")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Compares the time to reach a target energy from random and k-means starts.
+
+Optimises each village from both starting layouts over a ladder of Monte-
+Carlo steps, averaging the energy and wall time over SEEDS. The target is
+the mean energy of the random start with the most steps (plus TOLERANCE),
+the first rung of the ladder whose mean energy reaches it is reported.
+Usage: python benchmarks/init.py [village.csv ...]
+"""
+
+import sys
+import time
+
+from common import load
+
+from taptimise import optimise
+from taptimise.optimise import FAIRNESS
+
+VILLAGES = ["e2.csv", "e4.csv"]
+INITS = ["random", "kmeans"]
+STEPS = [1, 2, 5, 10, 20]
+SEEDS = [1, 2, 3]
+TAP_CAPACITY = 1000
+TOLERANCE = 0.01
+
+
+def run(raw_houses, init, steps):
+    # mean energy and wall time over SEEDS
+    energy = 0
+    seconds = 0
+
+    for seed in SEEDS:
+        tic = time.perf_counter()
+
+        result = optimise(
+            raw_houses,
+            TAP_CAPACITY,
+            steps=steps,
+            fair=FAIRNESS,
+            seed=seed,
+            init=init,
+        )
+
+        seconds += time.perf_counter() - tic
+        energy += result[4]
+
+    return energy / len(SEEDS), seconds / len(SEEDS)
+
+
+def main():
+    villages = sys.argv[1:] or VILLAGES
+
+    for name in villages:
+        raw_houses = load(name)
+
+        ladder = {
+            init: [run(raw_houses, init, steps) for steps in STEPS]
+            for init in INITS
+        }
+
+        target = ladder["random"][-1][0] * (1 + TOLERANCE)
+
+        print(f"{name}: {len(raw_houses)} houses, target {target:.4g}")
+        print(f"{'init':<8} {'steps':>5} {'energy':>10} {'time/s':>7}")
+
+        for init, rungs in ladder.items():
+            for steps, (energy, seconds) in zip(STEPS, rungs):
+                mark = " *" if energy <= target else ""
+                print(
+                    f"{init:<8} {steps:>5} {energy:>10.4g} {seconds:>7.1f}"
+                    f"{mark}"
+                )
+
+        for init, rungs in ladder.items():
+            reached = [s for e, s in rungs if e <= target]
+
+            if reached:
+                print(f"{init} reaches the target in {reached[0]:.1f}s")
+            else:
+                print(f"{init} never reaches the target")
+
+        print()
+
+
+if __name__ == "__main__":
+    main()
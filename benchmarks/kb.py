@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""Compares the vectorised kB estimate with the original estimate.
+
+The original averaged calc_kB over KB_AVERAGE_RUNS calls to randomise, which
+builds every random layout. Reports both estimates, the confidence interval
+of the vectorised one and the start up time saved.
+Usage: python benchmarks/kb.py [village.csv ...]
+"""
+
+import random
+import sys
+import time
+
+import numpy as np
+
+from common import load
+
+from taptimise.classes import Tap, House
+from taptimise.optimise import (
+    FAIRNESS,
+    randomise,
+    calc_kB,
+    estimate_kB,
+    KB_AVERAGE_RUNS,
+)
+
+VILLAGES = ["e1.csv", "e2.csv", "e3.csv", "e4.csv"]
+TAP_CAPACITY = 1000
+
+
+def looped_kB(houses, taps, rng):
+    kB = 0
+    for _ in range(KB_AVERAGE_RUNS):
+        randomise(houses, taps, rng)
+        kB += calc_kB(houses, taps)
+
+    return kB / KB_AVERAGE_RUNS
+
+
+def main():
+    villages = sys.argv[1:] or VILLAGES
+
+    Tap.BASE = FAIRNESS
+
+    print(
+        f"{'village':<8} {'houses':>6} {'looped kB':>10} {'vector kB':>10} "
+        f"{'± 95%':>8} {'looped/s':>9} {'vector/s':>9}"
+    )
+
+    for name in villages:
+        raw_houses = load(name)
+
+        tot_demand = sum(h[2] for h in raw_houses)
+        num_taps = max(1, round(tot_demand / TAP_CAPACITY))
+
+        houses = [House(*h, 3 * num_taps, -1) for h in raw_houses]
+        taps = [Tap(tot_demand / num_taps, i) for i in range(num_taps)]
+
+        tic = time.perf_counter()
+        old = looped_kB(houses, taps, random.Random(0))
+        looped = time.perf_counter() - tic
+
+        tic = time.perf_counter()
+        new, error = estimate_kB(houses, taps, np.random.default_rng(0))
+        vector = time.perf_counter() - tic
+
+        print(
+            f"{name:<8} {len(houses):>6} {old:>10.4g} {new:>10.4g} "
+            f"{error:>8.2g} {looped:>9.3f} {vector:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
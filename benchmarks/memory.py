@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+"""Measures the memory held by houses, taps and their buffers.
+
+Builds a random village of HOUSES houses on TAPS taps with full buffers
+(3 * TAPS entries each, as after a long run) and reports the bytes per house
+traced by tracemalloc, next to the same buffers held as lists of references
+to the taps. The time of one Monte-Carlo step is reported as well.
+Usage: python benchmarks/memory.py [houses] [taps]
+"""
+
+import random
+import sys
+import time
+import tracemalloc
+
+import common  # noqa: F401, puts taptimise on the path
+
+from taptimise.classes import Tap, House
+from taptimise.optimise import randomise, sweep, BUFFER_MULTIPLYER
+
+HOUSES = 20000
+TAPS = 700
+SIDE = 5000  # metres
+
+
+def traced(build):
+    # result of build and the bytes it left allocated
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    return result, after - before
+
+
+def main():
+    num_houses = int(sys.argv[1]) if len(sys.argv) > 1 else HOUSES
+    num_taps = int(sys.argv[2]) if len(sys.argv) > 2 else TAPS
+    buff_size = num_taps * BUFFER_MULTIPLYER
+
+    rng = random.Random(0)
+    Tap.BASE = 50
+
+    def village():
+        houses = [
+            House(rng.uniform(0, SIDE), rng.uniform(0, SIDE), 1, buff_size, -1)
+            for _ in range(num_houses)
+        ]
+        taps = [Tap(num_houses / num_taps, i) for i in range(num_taps)]
+
+        return houses, taps
+
+    (houses, taps), objects = traced(village)
+
+    def fill():
+        for h in houses:
+            for _ in range(buff_size):
+                h.buff.insert(taps[rng.randrange(num_taps)])
+
+    _, buffers = traced(fill)
+
+    # the same buffers as lists of tap references
+    _, lists = traced(lambda: [[taps[i] for i in h.buff.data] for h in houses])
+
+    randomise(houses, taps, rng)
+
+    for t in taps:
+        t.centralise()
+        t.score()
+
+    tic = time.perf_counter()
+    sweep(houses, taps, 0, [0, 0, 0], rng)
+    step = time.perf_counter() - tic
+
+    print(f"{num_houses} houses, {num_taps} taps, {buff_size} buffer slots")
+    print(f"houses and taps   {objects / num_houses:>10.0f} B per house")
+    print(f"typed buffers     {buffers / num_houses:>10.0f} B per house")
+    print(f"reference buffers {lists / num_houses:>10.0f} B per house")
+    print(f"total             {(objects + buffers) / 2 ** 20:>10.1f} MiB")
+    print(f"one MCS           {step:>10.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Compares flat optimisation with the clustered (multilevel) mode.
+
+Optimises each village flat and split into each of CLUSTERS clusters with
+the same seed and steps, and reports the energy relative to the flat run,
+the biggest walk, the number of houses refined near cluster borders and
+the wall time.
+Usage: python benchmarks/multilevel.py [village.csv ...]
+"""
+
+import sys
+import time
+
+from common import load
+
+from taptimise import optimise
+from taptimise.optimise import FAIRNESS
+
+VILLAGES = ["e1.csv", "e2.csv", "e3.csv", "e4.csv"]
+CLUSTERS = [2, 4]
+TAP_CAPACITY = 1000
+STEPS = 20
+SEED = 1
+
+
+def run(raw_houses, clusters):
+    tic = time.perf_counter()
+
+    result = optimise(
+        raw_houses,
+        TAP_CAPACITY,
+        steps=STEPS,
+        fair=FAIRNESS,
+        seed=SEED,
+        clusters=clusters,
+    )
+
+    return result, time.perf_counter() - tic
+
+
+def main():
+    villages = sys.argv[1:] or VILLAGES
+
+    print(
+        f"{'village':<8} {'houses':>6} {'clusters':>8} {'energy':>10} "
+        f"{'vs flat':>8} {'walk':>7} {'refined':>7} {'time/s':>7}"
+    )
+
+    for name in villages:
+        raw_houses = load(name)
+
+        flat = None
+
+        for clusters in [1] + CLUSTERS:
+            result, seconds = run(raw_houses, clusters)
+
+            if flat is None:
+                flat = result[4]
+
+            print(
+                f"{name:<8} {len(raw_houses):>6} {clusters:>8} "
+                f"{result[4]:>10.4g} {result[4] / flat:>8.3f} "
+                f"{result[2]:>7.1f} {result[5].get('refined', '-'):>7} "
+                f"{seconds:>7.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""Compares the buffer and nearest tap move proposals.
+
+Runs optimise on each village with both proposal methods from the same seed
+and reports the acceptance ratio of the main cooling stage (from the debug
+counters), the final energy and the run time.
+Usage: python benchmarks/proposal.py [steps] [village.csv ...]
+"""
+
+import sys
+
+from common import load
+
+from taptimise import optimise
+from taptimise.optimise import FAIRNESS
+
+VILLAGES = ["e2.csv", "e4.csv"]
+TAP_CAPACITY = 1000
+SEED = 0
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    villages = sys.argv[2:] or VILLAGES
+
+    print(
+        f"{'village':<8} {'proposal':<8} {'favour':>7} {'accept':>7} "
+        f"{'energy':>12} {'time/s':>8}"
+    )
+
+    for name in villages:
+        raw_houses = load(name)
+
+        for proposal in ["buffer", "nearest"]:
+            _, _, _, debug_data, energy, stats = optimise(
+                raw_houses,
+                TAP_CAPACITY,
+                steps=steps,
+                debug=True,
+                fair=FAIRNESS,
+                seed=SEED,
+                proposal=proposal,
+            )
+
+            counts = [sum(row[i] for row in debug_data[0]) for i in (2, 3, 4)]
+            total = sum(counts)
+
+            print(
+                f"{name:<8} {proposal:<8} {counts[0] / total:>7.3f} "
+                f"{(counts[0] + counts[1]) / total:>7.3f} "
+                f"{energy:>12.5g} {stats['time']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
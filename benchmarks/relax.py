@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+"""Compares the exhaustive, nearest neighbour and flow relaxation stages.
+
+Each village is annealed once, then both relaxation modes are run from copies
+of the same layout. Usage: python benchmarks/relax.py [steps]
+"""
+
+import math
+import random
+import sys
+import time
+
+from common import load
+
+from taptimise.classes import Tap, House
+from taptimise.optimise import (
+    FAIRNESS,
+    randomise,
+    calc_kB,
+    cool,
+    relax,
+    relax_nearest,
+    relax_flow,
+)
+
+VILLAGES = ["e2.csv", "e4.csv"]
+TAP_CAPACITY = 1000
+
+
+def build(raw_houses, num_taps, exp_load, assignment, positions):
+    houses = [House(*h, num_taps * 3, -1) for h in raw_houses]
+    taps = [Tap(exp_load, i) for i in range(num_taps)]
+
+    for t, pos in zip(taps, positions):
+        t.pos = pos
+
+    for h, i in zip(houses, assignment):
+        h.attach(taps[i])
+        h.buff.insert(taps[i])
+
+    for t in taps:
+        t.score()
+
+    return houses, taps
+
+
+def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+
+    Tap.BASE = FAIRNESS
+    random.seed(0)
+
+    rows = []
+
+    for name in VILLAGES:
+        raw_houses = load(name)
+        tot_demand = sum(h[2] for h in raw_houses)
+        num_taps = int(math.ceil(tot_demand / TAP_CAPACITY))
+        exp_load = tot_demand / num_taps
+
+        houses = [House(*h, num_taps * 3, -1) for h in raw_houses]
+        taps = [Tap(exp_load, i) for i in range(num_taps)]
+
+        randomise(houses, taps)
+        kB = calc_kB(houses, taps)
+        cool(houses, taps, steps * num_taps, kB, 2)
+
+        index = {id(t): i for i, t in enumerate(taps)}
+        assignment = [index[id(h.tap)] for h in houses]
+        positions = [t.pos for t in taps]
+        start = sum(t.energy for t in taps)
+
+        for mode, func in [
+            ("full", relax),
+            ("nearest", relax_nearest),
+            ("flow", relax_flow),
+        ]:
+            random.seed(1)
+            hs, ts = build(
+                raw_houses, num_taps, exp_load, assignment, positions
+            )
+
+            tic = time.perf_counter()
+            swaps = func(hs, ts)
+            toc = time.perf_counter()
+
+            energy = sum(t.energy for t in ts)
+            rows.append((name, mode, swaps, start, energy, toc - tic))
+
+    print()
+    print(
+        f"{'village':<8} {'mode':<8} {'swaps':>6} {'start E':>12} "
+        f"{'final E':>12} {'time/s':>8}"
+    )
+    for name, mode, swaps, start, energy, dt in rows:
+        print(
+            f"{name:<8} {mode:<8} {swaps:>6} {start:>12.5g} "
+            f"{energy:>12.5g} {dt:>8.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+
+"""Times command line start up and a tiny headless run.
+
+Runs "python -m taptimise" as a fresh process for each command, REPEATS
+times, and reports the fastest wall time. The tiny village is optimised
+with a handful of steps so the time is dominated by start up and output.
+Usage: python benchmarks/startup.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import TEST_DIR
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+REPEATS = 5
+VILLAGE = "e3.csv"
+
+
+def fastest(args, cwd):
+    env = dict(os.environ, PYTHONPATH=os.path.abspath(ROOT), MPLBACKEND="Agg")
+    best = float("inf")
+
+    for _ in range(REPEATS):
+        tic = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-m", "taptimise", *args],
+            cwd=cwd,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+        best = min(best, time.perf_counter() - tic)
+
+    return best
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copy(os.path.join(TEST_DIR, VILLAGE), tmp)
+
+        run = [VILLAGE, "-t", "1000", "-s", "2", "--seed", "1"]
+
+        commands = {
+            "python -c pass": None,
+            "-V": ["-V"],
+            "--help": ["--help"],
+            "run --quiet": run + ["--quiet"],
+            "run with report": run,
+        }
+
+        for name, args in commands.items():
+            if args is None:
+                tic = time.perf_counter()
+                subprocess.run([sys.executable, "-c", "pass"], check=True)
+                seconds = time.perf_counter() - tic
+            else:
+                seconds = fastest(args, tmp)
+
+            print(f"{name:<16} {seconds:.3f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,4 +2,10 @@
 
 __version__ = "3.2"
 
-from .optimise import optimise
+import logging
+
+from .optimise import optimise, fewest_taps
+from .result import Result
+
+# nothing is printed unless the application configures logging
+logging.getLogger(__name__).addHandler(logging.NullHandler())
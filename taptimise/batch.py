@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.batch: optimises many villages in a process pool."""
+
+import argparse
+import copy
+import csv
+import json
+import os
+import shlex
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stdout, redirect_stderr
+
+from .ingest import load_village
+from .optimise import optimise, fewest_taps
+from .options import add_village_options, village_options
+from .report import to_geo, write_taps, OUTPUT_SUFFIXES
+
+SUMMARY_NAME = "taptimise_summary.csv"
+SUMMARY_FIELDS = [
+    "village",
+    "status",
+    "houses",
+    "taps",
+    "max_walk",
+    "energy",
+    "time",
+    "seed",
+    "error",
+]
+
+
+def village_parser():
+    # options that can be given to every village on the command line and
+    # per village in a manifest, defaults match the single village CLI
+    parser = argparse.ArgumentParser(prog="taptimise batch", add_help=False)
+
+    add_village_options(parser)
+
+    return parser
+
+
+def batch(argv):
+    # entry point of "taptimise batch", argv excludes the "batch" command
+    villages = village_parser()
+
+    parser = argparse.ArgumentParser(
+        prog="taptimise batch",
+        parents=[villages],
+        description="Optimise every village in a directory or manifest. "
+        "Each line of a manifest is a path to a village (relative to the "
+        "manifest) optionally followed by options for that village alone.",
+    )
+    parser.add_argument(
+        "source", help="Directory of village csv's or a manifest file."
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        metavar="N",
+        help="Number of villages optimised at once, defaults to all cores.",
+    )
+    parser.add_argument(
+        "-o",
+        "--summary",
+        metavar="PATH",
+        help=f"Summary file (.csv or .json), defaults to {SUMMARY_NAME} "
+        "in the source directory.",
+    )
+
+    args = parser.parse_args(argv)
+
+    source = os.path.abspath(args.source)
+    summary = os.path.abspath(
+        args.summary
+        or os.path.join(
+            source if os.path.isdir(source) else os.path.dirname(source),
+            SUMMARY_NAME,
+        )
+    )
+
+    jobs = []
+
+    for path, extra in find_villages(source, summary):
+        # argparse only fills in defaults missing from the namespace so per
+        # village options are parsed on top of the command line options
+        try:
+            options = villages.parse_args(extra, namespace=copy.copy(args))
+        except SystemExit:
+            options = None
+
+        jobs.append((path, options))
+
+    print(
+        f"Optimising {len(jobs)} villages on",
+        f"{args.jobs or os.cpu_count()} processes.",
+    )
+
+    rows = []
+
+    with ProcessPoolExecutor(args.jobs) as pool:
+        futures = {
+            pool.submit(run_village, path, options): path
+            for path, options in jobs
+            if options is not None
+        }
+
+        for path, options in jobs:
+            if options is None:
+                rows.append(failed(path, "Invalid options"))
+                print(os.path.basename(path), "- invalid options")
+
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except Exception as err:  # the worker itself died
+                row = failed(futures[future], repr(err))
+
+            rows.append(row)
+
+            if row["status"] == "ok":
+                print(
+                    f"{row['village']} - {row['taps']} taps, biggest walk "
+                    f"{row['max_walk']:.1f}, {row['time']:.1f}s"
+                )
+            else:
+                print(f"{row['village']} - failed: {row['error']}")
+
+    rows.sort(key=lambda row: row["village"])
+
+    write_summary(summary, rows)
+
+    bad = sum(row["status"] != "ok" for row in rows)
+
+    print(f"{len(rows) - bad} villages optimised, {bad} failed.")
+    print("Summary written to", summary)
+
+    return 1 if bad else 0
+
+
+def find_villages(source, summary):
+    # yields (path, extra options) of every village in a directory or
+    # manifest, files written by taptimise are skipped
+    if os.path.isdir(source):
+        for name in sorted(os.listdir(source)):
+            path = os.path.join(source, name)
+
+            if (
+                name.lower().endswith(".csv")
+                and not name.endswith(OUTPUT_SUFFIXES)
+                and path != summary
+            ):
+                yield path, []
+
+        return
+
+    root = os.path.dirname(source)
+
+    with open(source, encoding="utf-8-sig") as f:
+        for line in f:
+            words = shlex.split(line, comments=True)
+
+            if words:
+                yield os.path.join(root, words[0]), words[1:]
+
+
+def failed(path, error):
+    # summary row of a village that could not be optimised
+    row = dict.fromkeys(SUMMARY_FIELDS)
+    row.update(village=os.path.basename(path), status="failed", error=error)
+
+    return row
+
+
+def run_village(path, args):
+    # worker for batch, optimises one village silently and writes its taps
+    # next to it. Any error is reported in the returned summary row.
+    tic = time.perf_counter()
+
+    try:
+        with open(os.devnull, "w") as null:
+            with redirect_stdout(null), redirect_stderr(null):
+                houses, taps, max_dist, energy, seed = solve(path, args)
+    except Exception as err:
+        return failed(path, repr(err))
+
+    write_taps(path[:-4], taps)
+
+    row = dict.fromkeys(SUMMARY_FIELDS)
+    row.update(
+        village=os.path.basename(path),
+        status="ok",
+        houses=len(houses),
+        taps=len(taps),
+        max_walk=max_dist,
+        energy=energy,
+        time=time.perf_counter() - tic,
+        seed=seed,
+    )
+
+    return row
+
+
+def solve(path, args):
+    # optimises a village returning its houses, its taps as lat, lon, index,
+    # load rows (see report.to_geo), the biggest walk, the energy and the
+    # seed used
+    raw_houses, convert, _ = load_village(path, args.scribble)
+
+    if args.tap_capacity is None:
+        if args.num_taps is None:
+            raise ValueError("Needs a tap capacity or number of taps")
+
+        args.tap_capacity = sum(h[2] for h in raw_houses) / args.num_taps
+
+    options = dict(village_options(args), debug=False)
+
+    if args.no_auto or args.max_distance < 0:
+        result = optimise(raw_houses, args.tap_capacity, **options)
+    else:
+        result = fewest_taps(
+            raw_houses, args.tap_capacity, search=args.search, **options
+        )
+
+    houses, taps, max_dist, _, energy, stats = result
+
+    to_geo(taps, convert)
+
+    return houses, taps, max_dist, energy, stats["seed"]
+
+
+def write_summary(path, rows):
+    # writes the summary rows as json if path ends in .json otherwise csv
+    if path.lower().endswith(".json"):
+        with open(path, "w") as f:
+            json.dump(rows, f, indent=2)
+    else:
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=SUMMARY_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
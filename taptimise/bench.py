@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.bench: times optimise on synthetic villages."""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+import numpy as np
+
+from . import __version__
+from .optimise import optimise, FAIRNESS
+
+MEAN_DEMAND = 100  # mean demand of a synthetic house
+DEMAND_SPREAD = 0.5  # relative spread of uniform and lognormal demands
+STAGES = ["kB", "scales", "init", "cool", "zero_temp", "relax"]
+
+
+def synthetic(
+    houses, clusters=10, spread=0.05, demand="constant", size=5000, seed=None
+):
+    # Random village of houses as [x, y, demand] rows in a size metre
+    # square. Houses gather around clusters uniformly placed centres with a
+    # normal spread (a fraction of size), clusters=0 scatters them
+    # uniformly. Demands are MEAN_DEMAND each, uniform or lognormal around
+    # it.
+    rng = np.random.default_rng(seed)
+
+    if clusters > 0:
+        centres = rng.uniform(0, size, (clusters, 2))
+        xy = centres[rng.integers(clusters, size=houses)]
+        xy = xy + rng.normal(0, spread * size, (houses, 2))
+    else:
+        xy = rng.uniform(0, size, (houses, 2))
+
+    if demand == "constant":
+        d = np.full(houses, MEAN_DEMAND, dtype=float)
+    elif demand == "uniform":
+        d = MEAN_DEMAND * rng.uniform(
+            1 - DEMAND_SPREAD, 1 + DEMAND_SPREAD, houses
+        )
+    elif demand == "lognormal":
+        d = MEAN_DEMAND * rng.lognormal(0, DEMAND_SPREAD, houses)
+    else:
+        raise ValueError(f"Unknown demand: {demand}")
+
+    return np.column_stack([xy, d]).tolist()
+
+
+def commit():
+    # git commit of the source tree, if it is a git checkout
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, houses, seed):
+    # one optimisation, returns its row of the results
+    options = dict(
+        steps=args.steps,
+        fair=args.fairness,
+        seed=seed,
+        engine=args.engine,
+        energy=args.energy,
+        proposal=args.proposal,
+        schedule=args.schedule,
+        relax_mode=args.relax,
+        init=args.init,
+    )
+
+    result = optimise(houses, args.tap_capacity, **options)
+
+    return dict(
+        houses=len(houses),
+        taps=len(result.taps),
+        seed=seed,
+        energy=float(result.energy),
+        max_walk=float(result.max_dist),
+        time=result.stats["time"],
+        stages=result.stats["stages"],
+    )
+
+
+def differences(old, new):
+    # (name, old, new) of every setting that differs between two results,
+    # the village sizes are left out as only the sizes both ran are compared
+    a, b = old.get("settings", {}), new["settings"]
+    names = sorted((set(a) | set(b)) - {"houses"})
+
+    return [(k, a.get(k), b.get(k)) for k in names if a.get(k) != b.get(k)]
+
+
+def compare(old, new):
+    # prints the median time and energy of new relative to old for every
+    # village size both ran
+    def medians(results, key):
+        sizes = {}
+        for row in results["runs"]:
+            sizes.setdefault(row["houses"], []).append(key(row))
+
+        return {n: statistics.median(v) for n, v in sizes.items()}
+
+    print()
+    print(f"Compared with {old.get('commit') or 'baseline'} (new / old):")
+    print(f"{'houses':>7} {'time':>7} {'energy':>7}", end="")
+    print("".join(f" {s:>9}" for s in STAGES))
+
+    keys = [lambda r: r["time"], lambda r: r["energy"]]
+    keys += [lambda r, s=s: r["stages"].get(s, 0) for s in STAGES]
+
+    columns = [(medians(old, k), medians(new, k)) for k in keys]
+
+    for n in sorted(set(columns[0][0]) & set(columns[0][1])):
+        ratios = [b[n] / a[n] if a[n] else float("nan") for a, b in columns]
+        print(f"{n:>7} {ratios[0]:>7.3f} {ratios[1]:>7.3f}", end="")
+        print("".join(f" {r:>9.3f}" for r in ratios[2:]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m taptimise.bench",
+        description="Time every stage of optimise on synthetic villages "
+        "and write the results as JSON.",
+    )
+    parser.add_argument(
+        "--houses",
+        type=int,
+        nargs="+",
+        default=[250, 500, 1000],
+        metavar="N",
+        help="Village sizes to run.",
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=10,
+        help="Number of clusters of houses, 0 scatters them uniformly.",
+    )
+    parser.add_argument(
+        "--spread",
+        type=float,
+        default=0.05,
+        help="Spread of a cluster as a fraction of the village width.",
+    )
+    parser.add_argument(
+        "--demand",
+        choices=["constant", "uniform", "lognormal"],
+        default="constant",
+        help="Distribution of house demands.",
+    )
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=3,
+        help="Villages (and seeds) per size.",
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seed of the first repeat."
+    )
+    parser.add_argument(
+        "-t",
+        "--tap-capacity",
+        type=float,
+        default=1000,
+        metavar="CAP",
+        help="Maximum load a single tap can support.",
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        type=int,
+        default=10,
+        help="Number of Monte-Carlo cooling steps per scale per tap.",
+    )
+    parser.add_argument(
+        "-f",
+        "--fairness",
+        type=int,
+        default=FAIRNESS,
+        metavar="FAIR",
+        help="Higher equals flatter load distibution.",
+    )
+    parser.add_argument(
+        "--engine", choices=["object", "numpy"], default="object"
+    )
+    parser.add_argument(
+        "--energy", choices=["distance", "squared"], default="distance"
+    )
+    parser.add_argument(
+        "--proposal", choices=["buffer", "nearest"], default="buffer"
+    )
+    parser.add_argument(
+        "--schedule",
+        choices=["geometric", "adaptive", "tempering"],
+        default="geometric",
+    )
+    parser.add_argument(
+        "--relax", choices=["full", "nearest", "flow"], default="full"
+    )
+    parser.add_argument(
+        "--init", choices=["random", "kmeans"], default="random"
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="bench.json",
+        metavar="PATH",
+        help="Results file, defaults to bench.json.",
+    )
+    parser.add_argument(
+        "--compare",
+        metavar="PATH",
+        help="Results of an earlier run to compare with.",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Compare with results of different settings anyway.",
+    )
+
+    args = parser.parse_args(argv)
+
+    results = dict(
+        version=__version__,
+        commit=commit(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        settings={
+            k: v
+            for k, v in vars(args).items()
+            if k not in ("output", "compare", "force")
+        },
+        runs=[],
+    )
+
+    old = None
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        # checked before running so a mismatch costs nothing
+        changed = differences(old, results)
+
+        if changed:
+            print(f"Settings differ from {args.compare}:", file=sys.stderr)
+
+            for name, a, b in changed:
+                print(f"    {name}: {a} -> {b}", file=sys.stderr)
+
+            if not args.force:
+                print(
+                    "Refusing to compare, pass --force to compare anyway.",
+                    file=sys.stderr,
+                )
+                return 1
+
+            print(
+                "WARNING - the energies and times are not comparable.",
+                file=sys.stderr,
+            )
+
+    print(f"{'houses':>7} {'seed':>5} {'taps':>5} {'energy':>10}", end="")
+    print(f" {'walk':>7} {'time':>7}", end="")
+    print("".join(f" {s:>9}" for s in STAGES))
+
+    for n in args.houses:
+        for seed in range(args.seed, args.seed + args.repeats):
+            houses = synthetic(
+                n, args.clusters, args.spread, args.demand, seed=seed
+            )
+            row = run(args, houses, seed)
+            results["runs"].append(row)
+
+            print(
+                f"{n:>7} {seed:>5} {row['taps']:>5} {row['energy']:>10.4g}"
+                f" {row['max_walk']:>7.1f} {row['time']:>7.2f}",
+                end="",
+            )
+            print("".join(f" {row['stages'].get(s, 0):>9.3f}" for s in STAGES))
+
+            # written as it goes so an interrupted run keeps its results
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+
+    print("Results written to", os.path.abspath(args.output))
+
+    if old is not None:
+        compare(old, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.checkpoint: saves and resumes annealing runs."""
+
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from .classes import INDEX_TYPES
+
+CHECKPOINT_INTERVAL = 25  # MCS between checkpoint writes
+
+
+class Checkpoint:
+    # Writes the full state of a run (layout, running sums, buffers, random
+    # state and cooling progress) to an npz file every interval MCS. info
+    # holds the settings of the run needed to resume it, stage counts the
+    # cooling stages finished and history holds their debug data. Writes go
+    # to a temporary file which then replaces path so a crash never leaves a
+    # torn checkpoint.
+    def __init__(self, path, houses, rng, info, interval=CHECKPOINT_INTERVAL):
+        self.path = os.path.abspath(path)
+        self.houses = houses
+        self.rng = rng
+        self.info = info
+        self.interval = interval
+        self.stage = 0
+        self.history = []
+
+    def due(self, step):
+        return self.interval > 0 and step % self.interval == 0
+
+    def save(self, taps, progress=None, data=()):
+        # progress is a json-able dict describing where in the current
+        # stage the run is (None at its start), data is the debug cooling
+        # data of the stage so far
+        houses = self.houses
+
+        # the buffers go in one (houses, longest buffer) matrix of the
+        # narrowest tap index type, each row is copied straight from its
+        # typed array
+        code = max(
+            (h.buff.data.typecode for h in houses),
+            key=INDEX_TYPES.index,
+            default=INDEX_TYPES[0],
+        )
+        width = max((len(h.buff.data) for h in houses), default=0)
+        buffers = np.zeros((len(houses), width), dtype=code)
+
+        for row, h in zip(buffers, houses):
+            indices = h.buff.data
+            row[: len(indices)] = np.frombuffer(indices, indices.typecode)
+
+        version, mt, gauss = self.rng.getstate()
+
+        info = dict(
+            self.info,
+            stage=self.stage,
+            progress=progress,
+            rng_version=version,
+            rng_gauss=gauss,
+        )
+
+        arrays = dict(
+            info=np.array(json.dumps(info)),
+            assignment=np.array([h.tap.index for h in houses], np.int64),
+            slots=np.array([h.slot for h in houses], dtype=np.int64),
+            pos=np.array([t.pos for t in taps], dtype=complex),
+            vec_sum=np.array([t.vec_sum for t in taps], dtype=complex),
+            sq_sum=np.array([t.sq_sum for t in taps], dtype=float),
+            load=np.array([t.load for t in taps], dtype=float),
+            energy=np.array([t.energy for t in taps], dtype=float),
+            old_energy=np.array([t.old_energy for t in taps], dtype=float),
+            buffers=buffers,
+            lengths=np.array([len(h.buff.data) for h in houses], np.int64),
+            cursors=np.array([h.buff.pos for h in houses], np.int64),
+            mt=np.array(mt, dtype=np.int64),
+            data=np.array(data, dtype=float).reshape(-1, 5),
+        )
+
+        for k, old in enumerate(self.history):
+            arrays[f"history_{k}"] = np.array(old, dtype=float).reshape(-1, 5)
+
+        fd, tmp = tempfile.mkstemp(
+            dir=os.path.dirname(self.path), suffix=".tmp"
+        )
+
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+def load(path):
+    # reads a checkpoint, returns its info dict and arrays
+    with np.load(path) as f:
+        arrays = {key: f[key] for key in f.files}
+
+    return json.loads(str(arrays.pop("info"))), arrays
+
+
+def restore(houses, taps, rng, info, arrays):
+    # puts houses, taps and rng back in the saved state, houses must not be
+    # attached to any tap
+    assignment = arrays["assignment"]
+
+    # attaching in slot order rebuilds every taps HouseSet exactly
+    order = np.lexsort((arrays["slots"], assignment))
+
+    for i, tap in zip(order.tolist(), assignment[order].tolist()):
+        houses[i].attach(taps[tap])
+
+    for t, pos, vec_sum, sq_sum, load, energy, old_energy in zip(
+        taps,
+        arrays["pos"].tolist(),
+        arrays["vec_sum"].tolist(),
+        arrays["sq_sum"].tolist(),
+        arrays["load"].tolist(),
+        arrays["energy"].tolist(),
+        arrays["old_energy"].tolist(),
+    ):
+        # the running sums are restored as saved, not recomputed, so the
+        # rounding is identical to an uninterrupted run
+        t.pos = pos
+        t.vec_sum = vec_sum
+        t.sq_sum = sq_sum
+        t.load = load
+        t.energy = energy
+        t.old_energy = old_energy
+
+    for h, row, length, cursor in zip(
+        houses,
+        arrays["buffers"],
+        arrays["lengths"].tolist(),
+        arrays["cursors"].tolist(),
+    ):
+        h.buff.load(row[:length].tolist(), cursor)
+
+    mt = tuple(arrays["mt"].tolist())
+    rng.setstate((info["rng_version"], mt, info["rng_gauss"]))
@@ -2,43 +2,177 @@
 
 import math
 import random
+from array import array
 
 
 DISTANCE_EXPONENT = 2
+INDEX_TYPES = "BHI"  # array typecodes of tap indices, narrowest first
+
+
+def penalised(bond, limit):
+    # a bond longer than the max walking distance limit (both distances, or
+    # both squared) grows steeply with the overshoot, works element-wise on
+    # numpy arrays
+    return bond * (bond / limit) ** DISTANCE_EXPONENT
 
 
 class Buffer:
-    # Basic circular buffer overwrites on wrap-around
+    # Basic circular buffer of tap indices, overwrites on wrap-around. The
+    # indices are held in the narrowest typed array that fits them (1, 2 or
+    # 4 bytes each) rather than as references to the taps.
+    __slots__ = ("size", "pos", "data")
+
     def __init__(self, size):
         self.size = size
         self.pos = 0
-        self.data = []
+        self.data = array(INDEX_TYPES[0])
+
+    def insert(self, tap):
+        try:
+            self.put(tap.index)
+        except OverflowError:
+            code = INDEX_TYPES[INDEX_TYPES.index(self.data.typecode) + 1]
+            self.data = array(code, self.data)
+            self.put(tap.index)
 
-    def insert(self, obj):
+    def put(self, i):
         if len(self.data) < self.size:
+            self.data.append(i)
             self.pos += 1
-            self.data.append(obj)
         else:
             if self.pos == self.size:
                 self.pos = 0
 
-            self.data[self.pos] = obj
+            self.data[self.pos] = i
             self.pos += 1
 
-    def rand(self):
-        return random.choice(self.data)
+    def rand(self, rng=random):
+        # index of a random tap in the buffer
+        return rng.choice(self.data)
+
+    def load(self, indices, pos):
+        # replaces the contents, used to restore a saved buffer
+        top = max(indices, default=0)
+        code = next(c for c in INDEX_TYPES if top < 1 << 8 * array(c).itemsize)
+
+        self.data = array(code, indices)
+        self.pos = pos
 
     def clear(self):
         self.pos = 0
-        self.data = []
+        self.data = array(INDEX_TYPES[0])
+
+
+class SumTree:
+    # Binary tree of partial sums over non-negative weights, sampling an
+    # index with probability proportional to its weight and updating a
+    # weight are both O(log n).
+    __slots__ = ("size", "tree")
+
+    def __init__(self, weights):
+        size = 1
+        while size < len(weights):
+            size *= 2
+
+        self.size = size
+        self.tree = [0.0] * (2 * size)
+        self.tree[size : size + len(weights)] = weights
+
+        for j in range(size - 1, 0, -1):
+            self.tree[j] = self.tree[2 * j] + self.tree[2 * j + 1]
+
+    def total(self):
+        return self.tree[1]
+
+    def update(self, i, weight):
+        # sums are recomputed rather than adjusted so rounding can not drift
+        tree = self.tree
+        j = i + self.size
+        tree[j] = weight
+
+        j //= 2
+        while j:
+            tree[j] = tree[2 * j] + tree[2 * j + 1]
+            j //= 2
+
+    def sample(self, rng=random):
+        tree = self.tree
+        size = self.size
+
+        while True:
+            u = rng.random() * tree[1]
+            j = 1
+
+            while j < size:
+                j *= 2
+                if u >= tree[j]:
+                    u -= tree[j]
+                    j += 1
+
+            # rounding can land on an empty leaf
+            if tree[j] > 0:
+                return j - size
+
+
+class HouseSet:
+    # Indexable set of houses, a list plus each houses slot in it. Adding,
+    # (swap) removing and indexing are all O(1) and the order depends only
+    # on the sequence of operations, never on memory addresses.
+    __slots__ = ("houses",)
+
+    def __init__(self):
+        self.houses = []
+
+    def add(self, house):
+        house.slot = len(self.houses)
+        self.houses.append(house)
+
+    def remove(self, house):
+        last = self.houses.pop()
+
+        # move the last house into the hole
+        if last is not house:
+            self.houses[house.slot] = last
+            last.slot = house.slot
+
+    def __getitem__(self, i):
+        return self.houses[i]
+
+    def __len__(self):
+        return len(self.houses)
+
+    def __iter__(self):
+        return iter(self.houses)
+
+    def __contains__(self, house):
+        i = house.slot
+        return (
+            i is not None and i < len(self.houses) and self.houses[i] is house
+        )
 
 
 class Tap:
     BASE = 1  # Contols dist vs flattness
+    SQUARED = False  # bond energy uses squared rather than plain distance
+    PENALTY = False  # some houses have a maximum walking distance
+
+    __slots__ = (
+        "index",
+        "pos",
+        "vec_sum",
+        "sq_sum",
+        "energy",
+        "old_energy",
+        "load",
+        "exp_load",
+        "houses",
+    )
 
-    def __init__(self, exp_load):
+    def __init__(self, exp_load, index=None):
+        self.index = index  # position in the list of taps, kept in buffers
         self.pos = complex(0, 0)
         self.vec_sum = complex(0, 0)
+        self.sq_sum = 0  # second moment, sum of demand * |pos|^2
 
         self.energy = 0
         self.old_energy = 0
@@ -46,7 +180,7 @@ class Tap:
         self.load = 0
         self.exp_load = exp_load
 
-        self.houses = set()
+        self.houses = HouseSet()
 
     def centralise(self):
         # set position to centroid
@@ -55,41 +189,111 @@ class Tap:
         else:
             self.pos = self.vec_sum / self.load
 
+    def refresh(self):
+        # recomputes the running sums from scratch to remove rounding drift
+        self.vec_sum = sum((h.pos * h.demand for h in self.houses), 0j)
+        self.sq_sum = sum(h.moment for h in self.houses)
+        self.load = sum(h.demand for h in self.houses)
+
+    def fairness(self, load):
+        return Tap.BASE ** (((load - self.exp_load) / self.exp_load) ** 2)
+
     def score(self):
         # updates the taps total energy and returns the energy change.
         self.old_energy = self.energy
-        self.energy = 0
 
+        if Tap.SQUARED and not Tap.PENALTY:
+            bonds = self.moment_energy()
+        else:
+            bonds = self.bond_energy()
+
+        self.energy = bonds * self.fairness(self.load)
+
+        return self.energy - self.old_energy
+
+    def moment_energy(self):
+        # sum of squared bond-energies from the running sums in O(1)
+        pos = self.pos
+        return (
+            self.sq_sum
+            - 2 * (self.vec_sum * pos.conjugate()).real
+            + self.load * (pos.real ** 2 + pos.imag ** 2)
+        )
+
+    def centred_energy(self, load, vec_sum, sq_sum):
+        # squared bond energy of a centralised tap with the given sums
+        if load == 0:
+            return 0
+
+        bonds = sq_sum - (vec_sum.real ** 2 + vec_sum.imag ** 2) / load
+
+        return bonds * self.fairness(load)
+
+    def transfer_delta(self, house, other):
+        # energy change from moving house from this tap to other and
+        # centralising both, only valid for squared bonds without penalties.
+        vec = house.pos * house.demand
+
+        old_energy = self.centred_energy(
+            self.load - house.demand,
+            self.vec_sum - vec,
+            self.sq_sum - house.moment,
+        )
+        new_energy = other.centred_energy(
+            other.load + house.demand,
+            other.vec_sum + vec,
+            other.sq_sum + house.moment,
+        )
+
+        return old_energy + new_energy - self.energy - other.energy
+
+    def bond_energy(self):
         # sums all bond-energies
+        energy = 0
+
         for h in self.houses:
-            sqdist = h.dist(self)
+            if Tap.SQUARED:
+                sqdist = h.sqdist(self)
+            else:
+                sqdist = h.dist(self)
 
             # penalise bonds longer than max walking distance
             if h.max_sq_dist > 0 and sqdist > h.max_sq_dist:
-                sqdist *= (sqdist / h.max_sq_dist) ** DISTANCE_EXPONENT
-
-            self.energy += sqdist * h.demand
+                sqdist = penalised(sqdist, h.max_sq_dist)
 
-        self.energy *= Tap.BASE ** (
-            ((self.load - self.exp_load) / self.exp_load) ** 2
-        )
+            energy += sqdist * h.demand
 
-        return self.energy - self.old_energy
+        return energy
 
 
 class House:
+    __slots__ = (
+        "pos",
+        "demand",
+        "moment",
+        "tap",
+        "buff",
+        "max_sq_dist",
+        "index",
+        "slot",
+    )
+
     def __init__(self, x, y, demand, buff_size, max_sq_dist):
         self.pos = complex(x, y)
         self.demand = demand
+        self.moment = demand * (x ** 2 + y ** 2)
         self.tap = None
         self.buff = Buffer(buff_size)
         self.max_sq_dist = max_sq_dist
+        self.index = None  # row in a HouseArrays, if any
+        self.slot = None  # position in its taps HouseSet
 
     def detach(self):
         # remove all traces from tap connection and disconnect
         if self.tap is not None:
             self.tap.houses.remove(self)
             self.tap.vec_sum -= self.pos * self.demand
+            self.tap.sq_sum -= self.moment
             self.tap.load -= self.demand
 
             self.tap = None
@@ -101,6 +305,7 @@ class House:
 
         tap.houses.add(self)
         tap.vec_sum += self.pos * self.demand
+        tap.sq_sum += self.moment
         tap.load += self.demand
 
         self.tap = tap
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.events: instrumentation of optimisation runs.
+
+An event sink is any callable taking a dict. optimise sends it:
+
+    run_start   houses, taps (None if chosen by demand), seed
+    stage_start stage
+    step        stage, scale, step, temp, kB, energy, accepted, uphill,
+                rejected, mcs_per_s (once per Monte-Carlo step of cooling,
+                of the coldest chain when tempering)
+    stage_end   stage, seconds
+    run_end     energy, max_walk, seconds
+
+every event also carries its "event" name and a unix "time" stamp.
+"""
+
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+
+
+def emit(sink, event, **fields):
+    # sends an event to sink, if there is one
+    if sink is not None:
+        sink(dict(event=event, time=time.time(), **fields))
+
+
+class Stages:
+    # Times the consecutive stages of a run. Each stage starts at enter and
+    # ends at the next enter or at close, its wall time is added to
+    # times[name] and stage_start and stage_end events go to sink.
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.times = {}
+        self.name = None
+        self.tic = 0
+
+    def enter(self, name):
+        self.close()
+
+        emit(self.sink, "stage_start", stage=name)
+
+        self.name = name
+        self.tic = time.perf_counter()
+
+    def close(self):
+        if self.name is None:
+            return
+
+        seconds = time.perf_counter() - self.tic
+        self.times[self.name] = self.times.get(self.name, 0) + seconds
+
+        emit(self.sink, "stage_end", stage=self.name, seconds=seconds)
+
+        self.name = None
+
+    def steps(self):
+        # per MCS callback for cool sending step events of the current
+        # stage, None without a sink so cooling pays nothing for it
+        if self.sink is None:
+            return None
+
+        sink = self.sink
+        stage = self.name
+        last = [time.perf_counter()]
+
+        def observe(scale, step, temp, kB, energy, counters, seconds=None):
+            # seconds is the wall time of the step if known, otherwise the
+            # time since the previous step is used
+            now = time.perf_counter()
+
+            if seconds is None:
+                seconds = now - last[0]
+
+            rate = 1 / seconds if seconds > 0 else None
+            last[0] = now
+
+            emit(
+                sink,
+                "step",
+                stage=stage,
+                scale=scale,
+                step=step,
+                temp=temp,
+                kB=kB,
+                energy=energy,
+                accepted=counters[0],
+                uphill=counters[1],
+                rejected=counters[2],
+                mcs_per_s=rate,
+            )
+
+        return observe
+
+
+class JsonLines:
+    # Event sink writing every event as a line of JSON to path.
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.file = open(self.path, "w")
+
+    def __call__(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Profiler:
+    # Event sink that runs cProfile over every stage, writing its statistics
+    # to directory/<n>_<stage>.prof (for pstats or snakeviz), and if memory
+    # traces allocations with tracemalloc adding the peak of each stage to
+    # its stage_end event as peak_memory (bytes), tracing stops at run_end.
+    # Events are then passed on to sink, if given.
+    def __init__(self, sink=None, directory=None, memory=False):
+        self.sink = sink
+        self.directory = directory
+        self.memory = memory
+        self.count = 0
+        self.profile = None
+        self.tracing = False  # tracemalloc was started by this profiler
+
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, event):
+        kind = event["event"]
+
+        if kind == "stage_start":
+            if self.memory:
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self.tracing = True
+
+                tracemalloc.reset_peak()
+
+            if self.directory is not None:
+                self.profile = cProfile.Profile()
+                self.profile.enable()
+
+        elif kind == "stage_end":
+            if self.profile is not None:
+                self.profile.disable()
+
+                self.count += 1
+                path = os.path.join(
+                    self.directory, f"{self.count:02d}_{event['stage']}.prof"
+                )
+                self.profile.dump_stats(path)
+                self.profile = None
+
+                event = dict(event, profile=path)
+
+            if self.memory:
+                event = dict(
+                    event, peak_memory=tracemalloc.get_traced_memory()[1]
+                )
+
+        elif kind == "run_end" and self.tracing:
+            tracemalloc.stop()
+            self.tracing = False
+
+        if self.sink is not None:
+            self.sink(event)
@@ -31,3 +31,14 @@ def to_html(h, d):
     table = ''.join(table)
 
     return f'<table>{table}</table>'
+
+
+def write_html(f, h, d):
+    # writes the table to file f row by row
+    f.write('<table>')
+    f.write(head(h))
+
+    for r in d:
+        f.write(row(r))
+
+    f.write('</table>')
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.ingest: reads village files into NumPy arrays."""
+
+import csv
+import itertools
+
+import numpy as np
+
+from .units import LocalXY
+
+CHUNK_ROWS = 2 ** 16  # lines parsed at once when reading a village
+
+
+def load_village(path, scribble=None):
+    # Reads a village into a list of x, y, demand rows in metres on the local
+    # tangent plane at the first house. Returns the rows, the LocalXY needed
+    # to convert back and the number of rows that could not be read.
+    raw_houses, bad = read_houses(path, scribble)
+
+    if len(raw_houses) == 0:
+        raise ValueError(f"No houses could be read from {path}")
+
+    convert = LocalXY(*raw_houses[0, 0:2])
+
+    raw_houses[:, 0], raw_houses[:, 1] = convert.geo2enu(
+        raw_houses[:, 0], raw_houses[:, 1]
+    )
+
+    return raw_houses.tolist(), convert, bad
+
+
+def read_houses(path, scribble=None, chunk=CHUNK_ROWS):
+    # Reads a village file in chunks of lines. Returns an (N, 3) array of
+    # lat, lon, demand rows and the number of rows that could not be read.
+    # Plain files hold lat, lon, demand per row, if scribble is not None the
+    # file is a Scribble Maps export and every Marker row is a house with
+    # demand scribble.
+    parse = parse_rows if scribble is None else scribble_parser(scribble)
+
+    blocks = []
+    bad = 0
+
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        while True:
+            lines = list(itertools.islice(f, chunk))
+
+            if not lines:
+                break
+
+            block, skipped = parse(lines)
+            blocks.append(block)
+            bad += skipped
+
+    if not blocks:
+        return np.empty((0, 3)), bad
+
+    return np.concatenate(blocks), bad
+
+
+def parse_rows(lines):
+    # parses lat, lon, demand lines, a chunk with no bad rows is parsed by
+    # NumPy in one go otherwise it falls back to a row at a time
+    lines = [line for line in lines if line.strip()]
+
+    if not lines:
+        return np.empty((0, 3)), 0
+
+    try:
+        block = np.loadtxt(lines, delimiter=",", comments=None, ndmin=2)
+
+        if block.shape[1] == 3:
+            return block, 0
+    except ValueError:
+        pass
+
+    rows = []
+    bad = 0
+
+    for row in csv.reader(lines):
+        try:
+            values = [float(elem) for elem in row]
+        except ValueError:
+            bad += 1
+            continue
+
+        if len(values) == 3:
+            rows.append(values)
+        else:
+            bad += 1
+
+    return np.array(rows, dtype=float).reshape(-1, 3), bad
+
+
+def scribble_parser(demand):
+    # returns a parser for Scribble Maps lines, Marker rows hold the lat and
+    # lon in columns 4 and 5, every other row is ignored
+    demand = float(demand)
+
+    def parse(lines):
+        rows = []
+        bad = 0
+
+        for row in csv.reader(lines):
+            if not row or row[0] != "Marker":
+                continue
+
+            try:
+                rows.append([float(row[4]), float(row[5]), demand])
+            except (IndexError, ValueError):
+                bad += 1
+
+        return np.array(rows, dtype=float).reshape(-1, 3), bad
+
+    return parse
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.multilevel: divide and conquer optimisation of large regions."""
+
+import math
+import os
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .classes import Tap, House
+from .optimise import run_replica, FAIRNESS
+from .spatial import kmeans, nearest
+
+BORDER_FACTOR = 1.5  # houses this much closer to a foreign tap are refined
+MIN_CLUSTER_TAPS = 8  # fewer taps per cluster than this are optimised flat
+
+log = logging.getLogger(__name__)
+
+
+def partitioned(houses, max_load, clusters, workers, seed, options):
+    # Splits the houses into spatial clusters by k-means, optimises every
+    # cluster in a process pool with taps in proportion to its demand, then
+    # re-anneals the taps near cluster borders together with all of their
+    # houses. Villages with fewer than MIN_CLUSTER_TAPS taps per cluster are
+    # optimised flat instead: a cluster of a few taps rarely holds the demand
+    # of a whole number of them, and the unfair loads of the merged layout are
+    # more than the border refinement can recover. Returns a result like
+    # optimise, the stats hold the time, houses and taps of every cluster and
+    # the size of the refinement.
+    tic = time.perf_counter()
+
+    seq = np.random.SeedSequence(seed)
+    split_seq, refine_seq, *cluster_seqs = seq.spawn(clusters + 2)
+
+    tot_demand = sum(h[2] for h in houses)
+    num_taps = options.get("num_taps")
+
+    if num_taps is None:
+        num_taps = int(math.ceil(tot_demand / max_load))
+
+    clusters = min(clusters, num_taps // MIN_CLUSTER_TAPS, len(houses))
+
+    if clusters < 2:
+        log.info("Too few taps to split into clusters, optimising flat.")
+        return run_replica((houses, max_load, seed, options))
+
+    points = np.array([complex(h[0], h[1]) for h in houses])
+    demand = np.array([h[2] for h in houses], dtype=float)
+
+    _, label = kmeans(
+        points, clusters, np.random.default_rng(split_seq), demand
+    )
+
+    members = [np.flatnonzero(label == c) for c in range(clusters)]
+    members = [m for m in members if len(m)]
+
+    allocation = allocate([demand[m].sum() for m in members], num_taps)
+
+    log.info(
+        "Optimising %d clusters on %d processes.",
+        len(members),
+        workers or os.cpu_count(),
+    )
+
+    jobs = [
+        (
+            [houses[i] for i in m],
+            max_load,
+            int(child.generate_state(1, np.uint64)[0]),
+            dict(options, num_taps=n, debug=False),
+        )
+        for m, n, child in zip(members, allocation, cluster_seqs)
+    ]
+
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(run_replica, jobs))
+
+    # merge the clusters, tap of every house as a global tap index
+    sites = []
+    owner = []
+    tap_of = np.empty(len(houses), dtype=np.intp)
+
+    for c, (m, res) in enumerate(zip(members, results)):
+        tap_of[m] = [len(sites) + h[2] for h in res[0]]
+        sites.extend(complex(t[0], t[1]) for t in res[1])
+        owner.extend([c] * len(res[1]))
+
+    sites = np.array(sites)
+    owner = np.array(owner)
+
+    # border houses could walk to a tap of another cluster instead
+    border = np.zeros(len(houses), dtype=bool)
+
+    for c, m in enumerate(members):
+        foreign = np.flatnonzero(owner != c)
+
+        if len(foreign) == 0:
+            continue
+
+        _, dist = nearest(points[m], sites[foreign])
+        walk = np.abs(points[m] - sites[tap_of[m]])
+
+        border[m] = dist < BORDER_FACTOR * walk
+
+    refine = np.unique(tap_of[border])
+    sub = np.flatnonzero(np.isin(tap_of, refine))
+
+    kB = float(np.mean([res[5]["kB"] for res in results]))
+
+    log.info(
+        "Refining %d houses on %d taps near borders.", len(sub), len(refine)
+    )
+
+    if len(refine) > 1:
+        # a fake result to warm start from, only its taps and kB are used
+        taps = [[p.real, p.imag] for p in sites[refine]]
+        warm = (None, taps, None, None, None, {"kB": kB})
+
+        res = run_replica(
+            (
+                [houses[i] for i in sub],
+                max_load,
+                int(refine_seq.generate_state(1, np.uint64)[0]),
+                dict(options, num_taps=len(refine), debug=False, warm=warm),
+            )
+        )
+
+        sites[refine] = [complex(t[0], t[1]) for t in res[1]]
+        tap_of[sub] = refine[[h[2] for h in res[0]]]
+
+    h_out, t_out, energy = score(houses, sites, tap_of, options)
+
+    stats = {
+        "seed": seq.entropy,
+        "kB": kB,
+        "clusters": [
+            {"houses": len(m), "taps": n, "time": res[5]["time"]}
+            for m, n, res in zip(members, allocation, results)
+        ],
+        "refined": len(sub),
+        "time": time.perf_counter() - tic,
+    }
+
+    return h_out, t_out, max(h[3] for h in h_out), [], energy, stats
+
+
+def allocate(demands, num_taps):
+    # splits num_taps in proportion to demands by largest remainder, every
+    # cluster gets at least one tap so there must be no more clusters than
+    # taps
+    total = sum(demands)
+    shares = [num_taps * d / total for d in demands]
+    counts = [max(1, int(s)) for s in shares]
+
+    order = sorted(range(len(demands)), key=lambda c: counts[c] - shares[c])
+
+    while sum(counts) < num_taps:
+        c = order.pop(0)
+        counts[c] += 1
+
+    # the minimum of one can overshoot, take the surplus back from the
+    # clusters with the smallest remainders that can spare a tap
+    while sum(counts) > num_taps:
+        c = max(
+            (c for c in range(len(counts)) if counts[c] > 1),
+            key=lambda c: counts[c] - shares[c],
+        )
+        counts[c] -= 1
+
+    return counts
+
+
+def score(houses, sites, tap_of, options):
+    # output rows and energy of the merged layout, like optimise
+    max_dist = options.get("max_dist", -1)
+    max_sq_dist = -1 if max_dist < 0 else max_dist ** 2
+
+    Tap.BASE = options.get("fair", FAIRNESS)
+    Tap.SQUARED = options.get("energy") == "squared"
+    Tap.PENALTY = max_sq_dist > 0
+
+    tot_demand = sum(h[2] for h in houses)
+
+    objs = [House(*h, 1, max_sq_dist) for h in houses]
+    taps = [Tap(tot_demand / len(sites), i) for i in range(len(sites))]
+
+    for t, pos in zip(taps, sites.tolist()):
+        t.pos = pos
+
+    for h, i in zip(objs, tap_of.tolist()):
+        h.attach(taps[i])
+
+    for t in taps:
+        t.score()
+
+    h_out = [
+        [h.pos.real, h.pos.imag, i, h.dist(h.tap)]
+        for h, i in zip(objs, tap_of.tolist())
+    ]
+    t_out = [
+        [t.pos.real, t.pos.imag, i, round(t.load)] for i, t in enumerate(taps)
+    ]
+
+    return h_out, t_out, sum(t.energy for t in taps)
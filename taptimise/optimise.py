@@ -1,19 +1,67 @@
 # -*- coding: utf-8 -*-
 
+import os
 import random
 import math
+import logging
 import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from tqdm import trange, tqdm
 
-from .classes import Tap, House
+from .classes import Tap, House, SumTree, penalised
+from .checkpoint import (
+    Checkpoint,
+    load as load_checkpoint,
+    restore as restore_checkpoint,
+)
+from .events import Stages, emit
+from .result import Result
+from .vectorised import HouseArrays, ArrayTap
+from .spatial import (
+    Grid,
+    pair_distances,
+    sample_distances,
+    min_separation,
+    nearest,
+    k_nearest,
+    kmeans,
+    CHUNK_SIZE,
+)
 
 BUFFER_MULTIPLYER = 3
+FAIRNESS = 50  # default Tap.BASE, higher gives flatter loads but longer walks
 STEP_MULTIPLYER = 100
 ZTC_MULTIPLYER = 1
+RELAX_NEIGHBOURS = 16  # swap partners per house in nearest mode
+FLOW_NEIGHBOURS = 8  # candidate taps per house in flow relaxation
+FLOW_ROUNDS = 20  # maximum reassign and centralise rounds of flow mode
+TEMPER_CHAINS = 8  # fewest default parallel tempering chains
+TEMPER_MAX_CHAINS = 64  # most default parallel tempering chains
+TEMPER_CHAIN_SCALE = 1.3  # default chains per square root of the houses
+LADDER_GAIN = 0.5  # how hard the tempering ladder evens out swap rates
+LADDER_SMOOTHING = 0.2  # weight of the newest swap in the smoothed rates
+SWAP_WARN = 0.05  # swap rates below this mean the chains hardly exchange
+SWAP_INTERVAL = 10  # MCS between parallel tempering exchanges
+NEAR_TAPS = 8  # nearest taps seeded into fresh house buffers
+WARM_TEMP = 0.1  # starting temperature (fraction of kB) of warm starts
+CONFIRM_RUNS = 3  # tries of a tap count before a gallop search rejects it
+KMEANS_TEMP = 0.2  # starting temperature (fraction of kB) of k-means starts
+ADAPT_START = 0.5  # target unfavourable acceptance rate at start of a scale
+ADAPT_END = 0.002  # target unfavourable acceptance rate at end of a scale
+ADAPT_GAIN = 0.5  # how hard the adaptive schedule chases the target
+CONVERGED_WINDOW = 20  # MCS of energies checked for convergence
+CONVERGED_SPREAD = 0.02  # energy standard deviation (in kB) deemed converged
 
 
 KB_AVERAGE_RUNS = 100
+SAMPLE_CONFIDENCE = 0.99  # for sampled length scale detection
+KB_CONFIDENCE = 1.96  # z-score of the kB confidence interval (95%)
+
+log = logging.getLogger(__name__)
 
 
 def print_through(val):
@@ -31,8 +79,109 @@ def optimise(
     max_dist=-1,
     buff_size=None,
     norelax=False,
-    fair=None,
+    fair=FAIRNESS,
+    engine="object",
+    energy="distance",
+    relax_mode="full",
+    scale_error=None,
+    replicas=1,
+    workers=None,
+    schedule="geometric",
+    chains=None,
+    seed=None,
+    proposal="buffer",
+    warm=None,
+    checkpoint=None,
+    resume=False,
+    clusters=None,
+    init="random",
+    events=None,
+    progress_bar=False,
 ):
+    # Returns a Result. Nothing is printed, messages go to the
+    # "taptimise.optimise" logger and tqdm progress bars are only drawn if
+    # progress_bar. If warm, a previous result, is given its taps are reused
+    # (extra taps are inserted at the furthest houses) and only a short low
+    # temperature anneal is performed. If checkpoint, a path, is given the run
+    # is saved there every CHECKPOINT_INTERVAL MCS and, if resume, a run saved
+    # there is continued exactly (its seed and number of taps replace the given
+    # ones, every other setting must match). If clusters > 1 the houses are
+    # split into that many spatial clusters optimised in parallel, see
+    # multilevel.partitioned. init is the starting layout, "random" or "kmeans"
+    # (see kmeans_start) which anneals from a lower temperature. events is an
+    # event sink (see taptimise.events) sent the stages and every cooling step
+    # of the run, replicas and clusters run in other processes so only report
+    # their whole run as a single stage.
+    if checkpoint is not None and (replicas > 1 or (clusters or 1) > 1):
+        raise ValueError("Checkpoints need a single replica and cluster")
+
+    saved = None
+
+    if resume:
+        if checkpoint is None:
+            raise ValueError("Resuming needs a checkpoint")
+
+        if os.path.exists(checkpoint):
+            saved = load_checkpoint(checkpoint)
+        else:
+            log.info("No checkpoint found, starting from scratch.")
+
+    if saved is not None:
+        seed = saved[0]["seed"]
+        num_taps = saved[0]["num_taps"]
+
+    tic = time.perf_counter()
+
+    emit(events, "run_start", houses=len(houses), taps=num_taps, seed=seed)
+
+    if replicas > 1 or ((clusters or 1) > 1 and warm is None):
+        options = dict(
+            num_taps=num_taps,
+            steps=steps,
+            debug=debug,
+            multiscale=multiscale,
+            max_dist=max_dist,
+            buff_size=buff_size,
+            norelax=norelax,
+            fair=fair,
+            engine=engine,
+            energy=energy,
+            relax_mode=relax_mode,
+            scale_error=scale_error,
+            schedule=schedule,
+            chains=chains,
+            proposal=proposal,
+            warm=warm,
+            init=init,
+        )
+
+        stages = Stages(events)
+
+        if replicas > 1:
+            options["clusters"] = clusters
+            stages.enter("replicas")
+            result = best_of(
+                houses, max_load, replicas, workers, seed, options
+            )
+        else:
+            from .multilevel import partitioned  # imports this module
+
+            stages.enter("clusters")
+            result = partitioned(
+                houses, max_load, clusters, workers, seed, options
+            )
+
+        stages.close()
+        return finish(events, result, tic)
+
+    # every random draw comes from rng, a run is reproducible from its seed
+    seq = np.random.SeedSequence(seed)
+    rng = random.Random(int(seq.generate_state(1, np.uint64)[0]))
+
+    stats = {"seed": seq.entropy}
+    stages = Stages(events)
+    stats["stages"] = stages.times  # wall time of every stage
+
     Tap.BASE = fair
     # finds optimal tap position for houses
     tot_demand = sum(h[2] for h in houses)
@@ -40,20 +189,22 @@ def optimise(
     if num_taps is None:
         num_taps = int(math.ceil(tot_demand / max_load))
     elif num_taps * max_load < tot_demand:
-        print("WARNING - Not enough taps to support village")
+        log.warning("Not enough taps to support village")
 
-    print("Attempting to optimise", num_taps, "taps.")
+    log.info("Attempting to optimise %d taps.", num_taps)
 
     avg_frac_load = tot_demand / (num_taps * max_load)
 
-    if steps is None:
+    if saved is not None:
+        steps = saved[0]["steps"]
+    elif steps is None:
         steps = int(num_taps * STEP_MULTIPLYER)
     else:
         steps = int(num_taps * steps)
 
     ztc_steps = int(steps * ZTC_MULTIPLYER)
 
-    print("Running,", steps / num_taps, "MCS per taps.")
+    log.info("Running, %s MCS per taps.", steps / num_taps)
 
     if buff_size is None:
         buff_size = num_taps * BUFFER_MULTIPLYER
@@ -63,44 +214,247 @@ def optimise(
     else:
         max_sq_dist = max_dist ** 2
 
+    if energy not in ("distance", "squared"):
+        raise ValueError(f"Unknown energy: {energy}")
+
+    if proposal not in ("buffer", "nearest"):
+        raise ValueError(f"Unknown proposal: {proposal}")
+
+    if init not in ("random", "kmeans"):
+        raise ValueError(f"Unknown init: {init}")
+
+    Tap.SQUARED = energy == "squared"
+    Tap.PENALTY = max_sq_dist > 0
+
     # main object lists
     houses = [House(*h, buff_size, max_sq_dist) for h in houses]
-    taps = [Tap(max_load * avg_frac_load) for _ in range(num_taps)]
 
-    kB = 0
-    # computes the expectation kB of a random (uncentalised) layout
-    for _ in range(KB_AVERAGE_RUNS):
-        randomise(houses, taps)
-        kB += calc_kB(houses, taps)
+    if engine == "object":
+        taps = [Tap(max_load * avg_frac_load, i) for i in range(num_taps)]
+    elif engine == "numpy":
+        arrays = HouseArrays(houses)
+        taps = [
+            ArrayTap(max_load * avg_frac_load, arrays, i)
+            for i in range(num_taps)
+        ]
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+
+    settings = dict(
+        houses=[
+            len(houses),
+            sum(h.pos.real + h.pos.imag for h in houses),
+            sum(h.demand for h in houses),
+        ],
+        max_load=max_load,
+        fair=fair,
+        max_dist=max_dist,
+        buff_size=buff_size,
+        engine=engine,
+        energy=energy,
+        schedule=schedule,
+        proposal=proposal,
+    )
+
+    if saved is not None:
+        info, arrays = saved
+
+        changed = [k for k, v in settings.items() if info["settings"][k] != v]
+
+        if changed:
+            raise ValueError(
+                f"Checkpoint was saved with different {', '.join(changed)}"
+            )
+
+        log.info("Resuming from %s", checkpoint)
+
+        kB = info["kB"]
+        num_scales = info["scales"]
+        temp0 = info["temp0"]
+
+        if info["kB_error"] is not None:
+            stats["kB_error"] = info["kB_error"]
+
+        restore_checkpoint(houses, taps, rng, info, arrays)
+    elif warm is None:
+        # kB is the expectation for a random (uncentalised) layout
+        stages.enter("kB")
+        kB, kB_error = estimate_kB(
+            houses, taps, np.random.default_rng(seq.spawn(1)[0])
+        )
+        stats["kB_error"] = kB_error
+
+        stages.enter("scales")
+
+        if multiscale is None:
+            num_scales = calc_scales(
+                houses,
+                sample_error=scale_error,
+                rng=np.random.default_rng(seq.spawn(1)[0]),
+            )
+        else:
+            num_scales = multiscale
+
+        stages.enter("init")
+
+        if init == "kmeans":
+            kmeans_start(houses, taps, np.random.default_rng(seq.spawn(1)[0]))
+            temp0 = KMEANS_TEMP
+        else:
+            randomise(houses, taps, rng)
+            temp0 = 1.0
+
+        stages.close()
+    else:
+        log.info("Warm starting from %d taps.", len(warm[1]))
 
-    kB /= KB_AVERAGE_RUNS
+        kB = warm[5]["kB"]
 
-    if multiscale is None:
-        num_scales = calc_scales(houses)
-    else:
-        num_scales = multiscale
+        stages.enter("init")
+        warm_start(houses, taps, [complex(t[0], t[1]) for t in warm[1]])
+        stages.close()
 
-    print()
-    print("Optimising over %d length scales:" % num_scales)
+        num_scales = 1
+        temp0 = WARM_TEMP
+
+    stats["kB"] = kB
+
+    if checkpoint is None:
+        ckpt = None
+    else:
+        ckpt = Checkpoint(
+            checkpoint,
+            houses,
+            rng,
+            dict(
+                seed=stats["seed"],
+                num_taps=num_taps,
+                steps=steps,
+                scales=num_scales,
+                temp0=temp0,
+                kB=kB,
+                kB_error=stats.get("kB_error"),
+                settings=settings,
+            ),
+        )
+
+    # stage is the number of cooling stages already finished and progress
+    # how far into the next one the run got
+    stage, progress = 0, None
+
+    if saved is not None:
+        stage, progress = info["stage"], info["progress"]
+
+        if progress is not None:
+            progress["data"] = arrays["data"].tolist()
+
+        ckpt.stage = stage
+        ckpt.history = [arrays[f"history_{k}"].tolist() for k in range(stage)]
+
+    log.info("Optimising over %d length scales:", num_scales)
     # main cooling
-    debug_data = []
+    debug_data = [] if ckpt is None else list(ckpt.history)
+    stages.enter("cool")
+
+    if stage > 0:
+        pass
+    elif schedule in ("geometric", "adaptive"):
+        run_info = cool(
+            houses,
+            taps,
+            steps,
+            kB,
+            num_scales,
+            debug=debug,
+            rng=rng,
+            proposal=proposal,
+            temp0=temp0,
+            adaptive=schedule == "adaptive",
+            stats=stats,
+            checkpoint=ckpt,
+            resume=progress,
+            observe=stages.steps(),
+            progress_bar=progress_bar,
+        )
+
+        # a single tap has nothing to cool, so no steps were saved either
+        if len(taps) > 1:
+            stats["steps_saved"] = steps * num_scales - stats["steps"]
+    elif schedule == "tempering":
+        run_info, stats["swap_rates"], stats["ladder"] = temper(
+            houses,
+            taps,
+            steps * num_scales,
+            kB,
+            temper_chains(len(houses)) if chains is None else chains,
+            workers=workers,
+            debug=debug,
+            rng=rng,
+            proposal=proposal,
+            temp0=temp0,
+            observe=stages.steps(),
+            progress_bar=progress_bar,
+        )
+    else:
+        raise ValueError(f"Unknown schedule: {schedule}")
 
-    run_info = cool(houses, taps, steps, kB, num_scales, debug=debug)
-    debug_data.append(run_info)
+    stages.close()
 
-    # zero temp cooling
-    print()
-    print("Zero temperature & pair wise optimisations:")
+    if stage == 0:
+        debug_data.append(run_info)
+        progress = None
 
-    run_info = cool(houses, taps, ztc_steps, -1, 1, debug=debug)
-    debug_data.append(run_info)
+        if ckpt is not None:
+            ckpt.stage = 1
+            ckpt.history.append(run_info)
+            ckpt.save(taps)
 
-    if not norelax:
-        print("Relaxed", relax(houses, taps), "pairs.")
+    # zero temp cooling
+    log.info("Zero temperature & pair wise optimisations:")
+
+    stages.enter("zero_temp")
+
+    if stage <= 1:
+        run_info = cool(
+            houses,
+            taps,
+            ztc_steps,
+            -1,
+            1,
+            debug=debug,
+            rng=rng,
+            proposal=proposal,
+            checkpoint=ckpt,
+            resume=progress,
+            observe=stages.steps(),
+            progress_bar=progress_bar,
+        )
+        debug_data.append(run_info)
+
+        if ckpt is not None:
+            ckpt.stage = 2
+            ckpt.history.append(run_info)
+            ckpt.save(taps)
+
+    stages.enter("relax")
+
+    if norelax:
+        pass
+    elif relax_mode == "full":
+        count = relax(houses, taps, rng, progress_bar)
+        log.info("Relaxed %d pairs.", count)
+    elif relax_mode == "nearest":
+        count = relax_nearest(houses, taps, rng, progress_bar=progress_bar)
+        log.info("Relaxed %d pairs.", count)
+    elif relax_mode == "flow":
+        log.info("Reassigned %d houses.", relax_flow(houses, taps))
+    else:
+        raise ValueError(f"Unknown relax mode: {relax_mode}")
+
+    stages.close()
 
     h_out = [
-        [h.pos.real, h.pos.imag, find_tap_index(h, taps), h.dist(h.tap)]
-        for h in houses
+        [h.pos.real, h.pos.imag, h.tap.index, h.dist(h.tap)] for h in houses
     ]
 
     t_out = [
@@ -109,138 +463,766 @@ def optimise(
 
     max_dist = max(out[3] for out in h_out)
 
-    return (h_out, t_out, max_dist, debug_data, sum(t.energy for t in taps))
+    stats["time"] = time.perf_counter() - tic
+
+    result = (
+        h_out,
+        t_out,
+        max_dist,
+        debug_data,
+        sum(t.energy for t in taps),
+        stats,
+    )
+
+    return finish(events, result, tic)
+
+
+def finish(events, result, tic):
+    # the Result of a run started at tic, sending its run_end event
+    result = Result(*result)
+
+    emit(
+        events,
+        "run_end",
+        energy=float(result[4]),
+        max_walk=float(result[2]),
+        seconds=time.perf_counter() - tic,
+    )
+
+    return result
+
+
+def fewest_taps(houses, max_load, max_dist, search="linear", **options):
+    # Optimises with more and more taps until no walk is longer than
+    # max_dist. Every rerun is warm started from the largest layout found so
+    # far that was too sparse. The "linear" search adds one tap at a time,
+    # "gallop" doubles the number of extra taps each rerun and then bisects
+    # between the last too sparse and the first good layout. A resumed
+    # search restarts from the run saved in the checkpoint. Every rerun is
+    # seeded from the seed of the first run, which is the seed in the stats
+    # of the result, so the whole search is reproducible from it.
+    if search not in ("linear", "gallop"):
+        raise ValueError(f"Unknown search: {search}")
+
+    options["max_dist"] = max_dist
+
+    # only the first run can resume, later runs overwrite the checkpoint
+    resume = options.pop("resume", False)
+
+    seed = options.pop("seed", None)
+
+    def rerun(num_taps, lo):
+        # The biggest walk of a run is noisy, a count of taps that failed
+        # once can pass with another seed. A gallop failure is only trusted
+        # as a lower bound of the search after CONFIRM_RUNS tries, each
+        # seeded from the search seed and the number of taps.
+        options["num_taps"] = num_taps
+        tries = CONFIRM_RUNS if search == "gallop" else 1
+        best = None
+
+        for k in range(tries):
+            child = seed
+
+            if k > 0:
+                child = np.random.SeedSequence(seed, spawn_key=(num_taps, k))
+                child = int(child.generate_state(1, np.uint64)[0])
+
+            result = optimise(houses, max_load, warm=lo, seed=child, **options)
+
+            if best is None or result[2] < best[2]:
+                best = result
+
+            if best[2] <= max_dist:
+                break
+
+        return best
+
+    result = optimise(houses, max_load, resume=resume, seed=seed, **options)
+
+    # a fresh or resumed first run picks the seed of the search
+    seed = result[5]["seed"]
+
+    lo = None  # largest layout with too long a walk
+    step = 1
+
+    while result[2] > max_dist:
+        lo = result
+        result = rerun(len(lo[1]) + step, lo)
 
+        if search == "gallop":
+            step *= 2
 
-def cool(houses, taps, steps, kB, scales, debug=False):
-    # performs a round of cooling to optimise tap positions
+    hi = result
+
+    while lo is not None and len(hi[1]) - len(lo[1]) > 1:
+        result = rerun((len(lo[1]) + len(hi[1])) // 2, lo)
+
+        if result[2] > max_dist:
+            lo = result
+        else:
+            hi = result
+
+    hi[5]["seed"] = seed
+
+    return hi
+
+
+def best_of(houses, max_load, replicas, workers, seed, options):
+    # runs independent optimisations in a process pool and returns the lowest
+    # energy result, the seed, energy and time of every replica are added to
+    # its stats. Replica seeds are derived from seed so the whole set is
+    # reproducible and any single replica can be rerun on its own. The stats
+    # seed is the parent seed, which reruns the whole set.
+    seq = np.random.SeedSequence(seed)
+    seeds = [
+        int(child.generate_state(1, np.uint64)[0])
+        for child in seq.spawn(replicas)
+    ]
+    jobs = [(houses, max_load, seed, options) for seed in seeds]
+
+    log.info(
+        "Running %d replicas on %d processes.",
+        replicas,
+        workers or os.cpu_count(),
+    )
+
+    with ProcessPoolExecutor(workers) as pool:
+        results = list(pool.map(run_replica, jobs))
+
+    best = min(results, key=lambda r: r[4])
+
+    best[5]["seed"] = seq.entropy
+    best[5]["replicas"] = [
+        {"seed": seed, "energy": r[4], "max_dist": r[2], "time": r[5]["time"]}
+        for seed, r in zip(seeds, results)
+    ]
+
+    return best
+
+
+def run_replica(job):
+    # worker for best_of and partitioned, runs a single optimisation
+    houses, max_load, seed, options = job
+
+    return optimise(houses, max_load, seed=seed, **options)
+
+
+def cool(
+    houses,
+    taps,
+    steps,
+    kB,
+    scales,
+    debug=False,
+    rng=random,
+    proposal="buffer",
+    temp0=1.0,
+    adaptive=False,
+    stats=None,
+    checkpoint=None,
+    resume=None,
+    observe=None,
+    progress_bar=False,
+):
+    # performs a round of cooling to optimise tap positions, each scale cools
+    # from temp0 to temp0 / 100. New taps are proposed from each houses
+    # buffer or, if proposal is "nearest", from the NEAR_TAPS taps closest to
+    # the house. If adaptive the temperature instead follows the acceptance
+    # rate (see adapt) and a scale ends early once the energy has converged.
+    # The number of MCS run is added to stats["steps"] if stats is given.
+    # If checkpoint is given the progress is saved every few MCS, resume is
+    # the progress of a saved run to continue from. observe, if given, is
+    # called after every MCS with its scale, step, temperature, kB, energy,
+    # acceptance counters and optionally its wall time in seconds. A
+    # progress bar is drawn if progress_bar.
     energy = 0
     data = []
-
-    for t in taps:
-        t.centralise()
-        t.score()
-        energy += t.energy
+    run = 0
+
+    temp = temp0
+    window = []
+    first_scale, first_step = 0, 0
+
+    if resume is None:
+        for t in taps:
+            t.refresh()
+            t.centralise()
+            t.score()
+            energy += t.energy
+    else:
+        energy, data, run = resume["energy"], resume["data"], resume["run"]
+        temp, window, kB = resume["temp"], resume["window"], resume["kB"]
+        first_scale, first_step = resume["scale"], resume["step"]
 
     # one tap edge case
     if len(taps) <= 1:
         if debug:
             data.append([1, energy, 0, 0, 0])
 
+        if stats is not None:
+            stats["steps"] = stats.get("steps", 0)
+
         return data
 
-    base = 10 ** -(2 / steps)  # 1 > temp_end > 0.01
+    record = recorder(data, debug, observe)
 
-    num_taps = len(taps)
+    base = 10 ** -(2 / steps)  # 1 > temp_end > 0.01
 
-    for scale in range(scales):
-        temp = 1.0
-        for i in trange(steps, ascii=True):
-            temp = base * temp
-
-            if debug:
-                counters = [0, 0, 0]
-
-            # for rejection sampling, does not matter that it is not updated every
-            # house as worst case all taps become equally (un)likely
-            emax = max(t.energy for t in taps)
-
-            for _ in range(len(houses)):
-                # rejection sampling to choose a house connected to a tap with a
-                # probability proportional to the taps energy
-                while True:
-                    old_tap = taps[int(random.random() * num_taps)]
-                    p = old_tap.energy / emax
-                    rand = random.random()
-
-                    if p >= 1 or rand < p:
-                        # This is a bad way to extract a random element fom a set.
-                        j = int(random.random() * len(old_tap.houses))
-                        h = tuple(old_tap.houses)[j]
-                        break
-                    elif rand < 0.01:
-                        # Hacky fix for large emax issues
-                        emax = max(t.energy for t in taps)
-
-                # picks a new tap from buffer i.e more likely to be a near by tap
-                new_tap = h.buff.rand()
-
-                # if new tap is current tap pick another tap using rejection
-                # sampling such that probability of picking new tap is proportional
-                # to 1 - tap.energy / emax
-                while new_tap is old_tap:
-                    for _ in range(num_taps):
-                        new_tap = taps[int(random.random() * num_taps)]
-                        p = new_tap.energy / emax
-                        if (
-                            p <= 0
-                            or random.random() > p
-                            or len(new_tap.houses) == 1
-                        ):
-                            break
-                    else:  # nobreak
-                        new_tap = random.choice(taps)
-
-                # move house to new tap
-                h.detach()
-                h.attach(new_tap)
-
-                old_tap.centralise()
-                new_tap.centralise()
-
-                delta_E = old_tap.score() + new_tap.score()
-
-                if delta_E < 0:
-                    # accept favourable move
-                    if debug:
-                        counters[0] += 1
-
-                    energy += delta_E
-                    h.buff.insert(new_tap)
-
-                elif kB > 0 and random.random() < math.exp(
-                    -delta_E / (kB * temp)
-                ):
-                    # accept unfavourable move
-                    if debug:
-                        counters[1] += 1
-
-                    energy += delta_E
-                    h.buff.insert(new_tap)
-
-                else:
-                    # reject unfavourable move
-                    if debug:
-                        counters[2] += 1
-
-                    h.detach()
-                    h.attach(old_tap)
-
-                    old_tap.energy = old_tap.old_energy
-                    new_tap.energy = new_tap.old_energy
-
-                    old_tap.centralise()
-                    new_tap.centralise()
-
-                    h.buff.insert(old_tap)
-
-            if debug:
-                data.append([temp, energy, *counters])
+    near = Grid(t.pos for t in taps) if proposal == "nearest" else None
+
+    for scale in range(first_scale, scales):
+        for i in trange(
+            first_step,
+            steps,
+            initial=first_step,
+            ascii=True,
+            disable=not progress_bar,
+        ):
+            if checkpoint is not None and checkpoint.due(i):
+                progress = dict(
+                    scale=scale,
+                    step=i,
+                    temp=temp,
+                    window=window[-CONVERGED_WINDOW:],
+                    kB=kB,
+                    energy=energy,
+                    run=run,
+                )
+                checkpoint.save(taps, progress, data)
+
+            if not adaptive:
+                temp = base * temp
+
+            counters = [0, 0, 0]
+
+            energy += sweep(houses, taps, kB * temp, counters, rng, near)
+            run += 1
+
+            if record is not None:
+                record(scale, i, temp, kB, energy, counters)
+
+            if adaptive and kB > 0:
+                temp = adapt(temp, base, counters, i / steps)
+
+                window.append(energy)
+                if converged(window[-CONVERGED_WINDOW:], kB):
+                    break
+
+        for t in taps:
+            t.refresh()
+
+        temp = temp0
+        window = []
+        first_step = 0
 
         new_kB = calc_kB(houses, taps)
         if new_kB < kB:
             kB = new_kB
         elif scale != scales - 1:
-            print("Stationary state detected - breaking loop early.")
+            log.info("Stationary state detected - breaking loop early.")
             break
 
     else:  # nobreak
         if kB > 0:
-            print("All length scales relaxed.")
+            log.info("All length scales relaxed.")
+
+    if stats is not None:
+        stats["steps"] = stats.get("steps", 0) + run
 
     return data
 
 
+def recorder(data, debug, observe):
+    # per MCS callback of cool, appending the debug data if debug and then
+    # calling observe. None if there is nothing to record so a plain run
+    # skips it entirely.
+    if not debug:
+        return observe
+
+    def record(scale, step, temp, kB, energy, counters, seconds=None):
+        data.append([temp, energy, *counters])
+
+        if observe is not None:
+            observe(scale, step, temp, kB, energy, counters, seconds)
+
+    return record
+
+
+def adapt(temp, base, counters, progress):
+    # Next temperature of the adaptive schedule. The target fraction of
+    # unfavourable moves accepted falls geometrically from ADAPT_START to
+    # ADAPT_END over a scale. The temperature is cooled by base, like the
+    # geometric schedule, and then scaled towards the target acceptance.
+    target = ADAPT_START * (ADAPT_END / ADAPT_START) ** progress
+    tried = counters[1] + counters[2]
+
+    if tried == 0:
+        return base * temp
+
+    rate = max(counters[1] / tried, ADAPT_END / 10)
+    factor = (target / rate) ** ADAPT_GAIN
+
+    return base * temp * min(max(factor, 0.5), 2)
+
+
+def converged(energies, kB):
+    # True if a full window of energies fluctuates by much less than kB, the
+    # typical energy of a single move at this length scale
+    if len(energies) < CONVERGED_WINDOW:
+        return False
+
+    return statistics.pstdev(energies) <= CONVERGED_SPREAD * kB
+
+
+def temper(
+    houses,
+    taps,
+    steps,
+    kB,
+    chains,
+    workers=None,
+    debug=False,
+    rng=random,
+    proposal="buffer",
+    temp0=1.0,
+    observe=None,
+    progress_bar=False,
+):
+    # Parallel tempering (replica exchange). Runs copies of the layout at a
+    # ladder of temperatures temp0 * kB > kT > temp0 * kB / 100 for steps MCS
+    # in a process pool. Every SWAP_INTERVAL MCS neighbouring chains try to
+    # exchange configurations. The ladder starts geometric and its spacing is
+    # adapted as the run goes, narrowing the gaps whose smoothed acceptance
+    # is below the mean, so no pair of chains stops exchanging while others
+    # swap freely. A configuration (see chain_state)
+    # carries the buffers and tap membership order with the layout, so a
+    # chain's moves never depend on which process ran it before. Leaves houses
+    # and taps in the configuration of the coldest chain and returns its
+    # cooling data, the exchange acceptance rate of each neighbouring pair of
+    # temperatures and the final ladder (fractions of kB). observe, as for cool, is called for every MCS of the
+    # coldest chain once its round is done.
+    if chains < 2:
+        raise ValueError("Parallel tempering needs at least two chains")
+
+    if len(taps) <= 1:
+        data = cool(
+            houses,
+            taps,
+            steps,
+            kB,
+            1,
+            debug=debug,
+            rng=rng,
+            proposal=proposal,
+            observe=observe,
+        )
+        return data, [], []
+
+    # log temperature gaps of the ladder, they always span a factor of 100
+    span = math.log(100)
+    gaps = [span / (chains - 1)] * (chains - 1)
+    ladder = rungs(temp0, gaps)
+
+    # smoothed probability of accepting an exchange of each pair
+    accept = [1.0] * (chains - 1)
+
+    for t in taps:
+        t.refresh()
+        t.centralise()
+        t.score()
+
+    states = [chain_state(houses, taps)] * chains
+    energies = [sum(t.energy for t in taps)] * chains
+
+    tries = [0] * (chains - 1)
+    swaps = [0] * (chains - 1)
+
+    data = []
+    record = recorder(data, debug, observe)
+
+    spec = state_spec(houses, taps)
+
+    with ProcessPoolExecutor(
+        workers, initializer=init_chain, initargs=(spec,)
+    ) as pool:
+        rounds = int(math.ceil(steps / SWAP_INTERVAL))
+
+        for r in trange(rounds, ascii=True, disable=not progress_bar):
+            sweeps = min(SWAP_INTERVAL, steps - r * SWAP_INTERVAL)
+
+            jobs = [
+                (state, kB, temp, sweeps, rng.getrandbits(64), proposal)
+                for state, temp in zip(states, ladder)
+            ]
+
+            tic = time.perf_counter()
+            results = list(pool.map(run_chain, jobs))
+            seconds = (time.perf_counter() - tic) / sweeps
+
+            states = [res[0] for res in results]
+            energies = [res[1] for res in results]
+
+            if record is not None:
+                for i, (temp, energy, *counters) in enumerate(results[-1][2]):
+                    step = r * SWAP_INTERVAL + i
+                    record(0, step, temp, kB, energy, counters, seconds)
+
+            # alternate between even and odd pairs so every pair is tried
+            for i in range(r % 2, chains - 1, 2):
+                tries[i] += 1
+
+                delta = (1 / ladder[i] - 1 / ladder[i + 1]) / kB
+                delta *= energies[i] - energies[i + 1]
+
+                chance = 1.0 if delta >= 0 else math.exp(delta)
+                accept[i] += LADDER_SMOOTHING * (chance - accept[i])
+
+                if rng.random() < chance:
+                    swaps[i] += 1
+
+                    states[i], states[i + 1] = states[i + 1], states[i]
+                    energies[i], energies[i + 1] = (
+                        energies[i + 1],
+                        energies[i],
+                    )
+
+            mean = statistics.fmean(accept)
+            gaps = [
+                g * math.exp(LADDER_GAIN * (a - mean))
+                for g, a in zip(gaps, accept)
+            ]
+            gaps = [g * span / sum(gaps) for g in gaps]
+            ladder = rungs(temp0, gaps)
+
+    load_chain(houses, taps, states[-1])
+
+    rates = [s / t if t else 0 for s, t in zip(swaps, tries)]
+
+    # a rate below SWAP_WARN only shows after 1 / SWAP_WARN tries
+    if min(rates) < SWAP_WARN and min(tries) * SWAP_WARN >= 1:
+        log.warning(
+            "Tempering chains hardly exchanged (lowest swap rate %.2f), "
+            "try more chains.",
+            min(rates),
+        )
+
+    return data, rates, ladder
+
+
+def rungs(temp0, gaps):
+    # temperatures of a tempering ladder from temp0 down by log gaps
+    ladder = [temp0]
+
+    for g in gaps:
+        ladder.append(ladder[-1] * math.exp(-g))
+
+    return ladder
+
+
+def temper_chains(num_houses):
+    # default number of tempering chains, the energy fluctuations grow with
+    # the square root of the houses and neighbouring temperatures only
+    # exchange while their energy distributions overlap
+    chains = math.ceil(TEMPER_CHAIN_SCALE * math.sqrt(num_houses))
+
+    return min(max(chains, TEMPER_CHAINS), TEMPER_MAX_CHAINS)
+
+
+def warm_start(houses, taps, positions):
+    # places taps at positions and attaches every house to its nearest tap.
+    # Surplus positions closest to the fewest houses are dropped and missing
+    # taps are inserted one at a time at the house furthest from any tap.
+    points = [h.pos for h in houses]
+    sites = list(positions)
+
+    while len(sites) > len(taps):
+        index, _ = nearest(points, sites)
+        counts = np.bincount(index, minlength=len(sites))
+        del sites[int(counts.argmin())]
+
+    index, dist = nearest(points, sites)
+    points = np.asarray(points)
+
+    while len(sites) < len(taps):
+        far = int(dist.argmax())
+        sites.append(points[far])
+
+        new_dist = np.abs(points - points[far])
+        closer = new_dist < dist
+
+        index[closer] = len(sites) - 1
+        dist[closer] = new_dist[closer]
+
+    for t, pos in zip(taps, sites):
+        t.pos = complex(pos)
+
+    for h, i in zip(houses, index):
+        h.detach()
+        h.attach(taps[i])
+        h.buff.insert(taps[i])
+
+    seed_buffers(houses, taps)
+
+
+def kmeans_start(houses, taps, rng):
+    # places taps at the centres of a capacity constrained k-means of the
+    # houses weighted by demand and attaches every house to its cluster, so
+    # no tap is given much more than its expected load
+    centres, index = kmeans(
+        [h.pos for h in houses],
+        len(taps),
+        rng,
+        [h.demand for h in houses],
+        capacity=taps[0].exp_load,
+    )
+
+    for t, pos in zip(taps, centres.tolist()):
+        t.pos = pos
+
+    for h, i in zip(houses, index.tolist()):
+        h.detach()
+        h.attach(taps[i])
+        h.buff.insert(taps[i])
+
+    seed_buffers(houses, taps)
+
+
+def state_spec(houses, taps):
+    # everything needed to rebuild an equivalent set of houses and taps in
+    # another process
+    return dict(
+        houses=[
+            (h.pos.real, h.pos.imag, h.demand, h.max_sq_dist) for h in houses
+        ],
+        buff_size=houses[0].buff.size,
+        exp_load=taps[0].exp_load,
+        num_taps=len(taps),
+        numpy=isinstance(taps[0], ArrayTap),
+        base=Tap.BASE,
+        squared=Tap.SQUARED,
+        penalty=Tap.PENALTY,
+    )
+
+
+def build_state(spec):
+    # inverse of state_spec, the houses are not attached to any tap
+    Tap.BASE = spec["base"]
+    Tap.SQUARED = spec["squared"]
+    Tap.PENALTY = spec["penalty"]
+
+    houses = [
+        House(x, y, demand, spec["buff_size"], max_sq_dist)
+        for x, y, demand, max_sq_dist in spec["houses"]
+    ]
+
+    if spec["numpy"]:
+        arrays = HouseArrays(houses)
+        taps = [
+            ArrayTap(spec["exp_load"], arrays, i)
+            for i in range(spec["num_taps"])
+        ]
+    else:
+        taps = [Tap(spec["exp_load"], i) for i in range(spec["num_taps"])]
+
+    return houses, taps
+
+
+def layout(houses, taps):
+    # returns the tap index of every house and the tap positions
+    return [h.tap.index for h in houses], [t.pos for t in taps]
+
+
+def restore(houses, taps, state):
+    # inverse of layout, leaves every tap scored
+    assignment, positions = state
+
+    for h, i in zip(houses, assignment):
+        if h.tap is not taps[i]:
+            h.detach()
+            h.attach(taps[i])
+            h.buff.insert(taps[i])
+
+    for t, pos in zip(taps, positions):
+        t.pos = pos
+        t.refresh()
+        t.score()
+
+
+def chain_state(houses, taps):
+    # the tap and slot (place in its taps HouseSet) of every house, the tap
+    # positions and every houses buffer, all the state a sweep depends on
+    return (
+        [h.tap.index for h in houses],
+        [h.slot for h in houses],
+        [t.pos for t in taps],
+        [(h.buff.data, h.buff.pos) for h in houses],
+    )
+
+
+def load_chain(houses, taps, state):
+    # inverse of chain_state, leaves every tap scored
+    assignment, slots, positions, buffers = state
+
+    for h in houses:
+        h.detach()
+
+    # attaching in slot order rebuilds every taps HouseSet exactly
+    order = sorted(range(len(houses)), key=lambda k: (assignment[k], slots[k]))
+
+    for k in order:
+        houses[k].attach(taps[assignment[k]])
+
+    for h, (data, pos) in zip(houses, buffers):
+        h.buff.load(data, pos)
+
+    for t, pos in zip(taps, positions):
+        t.pos = pos
+        t.refresh()
+        t.score()
+
+
+def seed_buffers(houses, taps, k=NEAR_TAPS):
+    # fills empty buffers with the k nearest taps
+    grid = Grid(t.pos for t in taps)
+
+    for h in houses:
+        for i in grid.knn(h.pos, min(k, len(taps), h.buff.size)):
+            h.buff.insert(taps[i])
+
+
+CHAIN = None  # per process houses and taps for run_chain
+
+
+def init_chain(spec):
+    global CHAIN
+    CHAIN = build_state(spec)
+
+
+def run_chain(job):
+    # worker for temper, runs sweeps MCS at temperature kB * temp
+    state, kB, temp, sweeps, seed, proposal = job
+    houses, taps = CHAIN
+
+    load_chain(houses, taps, state)
+
+    rng = random.Random(seed)
+    near = Grid(t.pos for t in taps) if proposal == "nearest" else None
+
+    energy = sum(t.energy for t in taps)
+    data = []
+
+    for _ in range(sweeps):
+        counters = [0, 0, 0]
+        energy += sweep(houses, taps, kB * temp, counters, rng, near)
+        data.append([temp, energy, *counters])
+
+    return chain_state(houses, taps), sum(t.energy for t in taps), data
+
+
+def sweep(houses, taps, kT, counters, rng=random, near=None):
+    # performs one Monte-Carlo step (one proposal per house) at temperature
+    # kT, zero temperature if kT <= 0. Tallies favourable, unfavourable-
+    # accepted and unfavourable-rejected moves in counters and returns the
+    # energy change. If near, a Grid over the tap positions, is given new
+    # taps are proposed from the taps nearest the house and the grid is kept
+    # up to date.
+    energy = 0
+    num_taps = len(taps)
+
+    if near is not None:
+        k = min(NEAR_TAPS, num_taps - 1)
+
+    # squared bonds without penalties have a closed form energy change so
+    # moves can be evaluated without touching the taps.
+    fast = Tap.SQUARED and not Tap.PENALTY
+
+    # houses are moved from taps chosen in proportion to their energy and,
+    # when the proposal fails, to taps chosen in inverse proportion.
+    energies = [max(t.energy, 0) for t in taps]
+    floor = sum(energies) / num_taps or 1.0
+    source = SumTree(energies)
+    sink = SumTree([1 / (e + floor) for e in energies])
+
+    for _ in range(len(houses)):
+        if source.total() > 0:
+            old_tap = taps[source.sample(rng)]
+        else:
+            # every house sits on its tap
+            old_tap = rng.choice([t for t in taps if t.houses])
+
+        h = old_tap.houses[int(rng.random() * len(old_tap.houses))]
+
+        if near is None:
+            # picks a new tap from buffer i.e more likely to be a near by tap
+            new_tap = taps[h.buff.rand(rng)]
+        else:
+            # pick one of the k nearest taps other than the current one
+            i = old_tap.index
+            new_tap = taps[rng.choice(near.knn(h.pos, k, exclude=i))]
+
+        # if new tap is current tap pick another with probability inversely
+        # proportional to its energy
+        while new_tap is old_tap:
+            new_tap = taps[sink.sample(rng)]
+
+        if fast:
+            delta_E = old_tap.transfer_delta(h, new_tap)
+        else:
+            move(h, new_tap)
+            delta_E = old_tap.score() + new_tap.score()
+
+        if delta_E < 0:
+            # accept favourable move
+            counters[0] += 1
+
+        elif kT > 0 and rng.random() < math.exp(-delta_E / kT):
+            # accept unfavourable move
+            counters[1] += 1
+
+        else:
+            # reject unfavourable move
+            counters[2] += 1
+
+            if not fast:
+                move(h, old_tap)
+
+                old_tap.energy = old_tap.old_energy
+                new_tap.energy = new_tap.old_energy
+
+            h.buff.insert(old_tap)
+            continue
+
+        if fast:
+            move(h, new_tap)
+            old_tap.score()
+            new_tap.score()
+
+        if near is not None:
+            near.move(old_tap.index, old_tap.pos)
+            near.move(new_tap.index, new_tap.pos)
+
+        for t in (old_tap, new_tap):
+            i = t.index
+            source.update(i, max(t.energy, 0))
+            sink.update(i, 1 / (max(t.energy, 0) + floor))
+
+        energy += delta_E
+        h.buff.insert(new_tap)
+
+    return energy
+
+
+def move(house, tap):
+    # moves house to tap and centralises its old and new tap
+    old_tap = house.tap
+
+    house.detach()
+    house.attach(tap)
+
+    old_tap.centralise()
+    tap.centralise()
+
+
 def swap(h1, h2):
     # tries to swap the taps connected to h1 and h2. Returns the energy of the
     # swap and a boolean encoding if a swap occured.
@@ -259,14 +1241,15 @@ def swap(h1, h2):
     return t1.score() + t2.score(), True
 
 
-def relax(houses, taps):
+def relax(houses, taps, rng=random, progress_bar=False):
     # Attempts to swap the taps connected to a pair of houses if the energy is
     # lowered does not affect tap positions
-    random.shuffle(houses)
+    houses = list(houses)
+    rng.shuffle(houses)
     swaps = 0
     avg = int(len(houses) / len(taps))
 
-    for h in tqdm(houses, ascii=True):
+    for h in tqdm(houses, ascii=True, disable=not progress_bar):
         for o in houses:
             delta_E, swapped = swap(h, o)
             if delta_E > 0:
@@ -277,7 +1260,239 @@ def relax(houses, taps):
     return swaps
 
 
-def randomise(houses, taps):
+def relax_nearest(
+    houses, taps, rng=random, k=RELAX_NEIGHBOURS, progress_bar=False
+):
+    # Like relax but only tries to swap each house with its k nearest houses
+    # that are connected to another tap.
+    houses = list(houses)
+    rng.shuffle(houses)
+    swaps = 0
+
+    # partners are drawn from a wider pool as some share the houses tap
+    pool = min(len(houses) - 1, 4 * k)
+    grid = Grid(h.pos for h in houses)
+    near = [
+        [houses[j] for j in grid.knn(h.pos, pool, exclude=i)]
+        for i, h in enumerate(houses)
+    ]
+
+    for h, others in zip(
+        tqdm(houses, ascii=True, disable=not progress_bar), near
+    ):
+        tried = 0
+        for o in others:
+            if o.tap is h.tap:
+                continue
+
+            tried += 1
+            if tried > k:
+                break
+
+            if not can_swap(h, o):
+                continue
+
+            delta_E, swapped = swap(h, o)
+            if delta_E > 0:
+                swap(h, o)
+            else:
+                swaps += swapped
+
+    return swaps
+
+
+def relax_flow(houses, taps, k=FLOW_NEIGHBOURS, rounds=FLOW_ROUNDS):
+    # Reassigns houses between their k nearest taps by a min cost
+    # circulation with the taps fixed: moving one house along every edge of
+    # a cycle of taps keeps the loads (of equal demand houses) so negative
+    # cycles are cancelled until none are left (see cancel_cycles). The cost
+    # of a house is its bond energy times the fairness of its tap. The taps
+    # are then centralised and this repeats until the energy stops falling.
+    # Returns the number of houses that changed tap.
+    if len(taps) < 2:
+        return 0
+
+    points = np.array([h.pos for h in houses])
+    demand = np.array([h.demand for h in houses], dtype=float)
+    limit = np.array([h.max_sq_dist for h in houses], dtype=float)
+
+    start = layout(houses, taps)[0]
+
+    for t in taps:
+        t.score()
+
+    energy = sum(t.energy for t in taps)
+
+    for _ in range(rounds):
+        state = layout(houses, taps)
+        assign = np.array(state[0])
+        sites = np.array(state[1])
+
+        choices, dist = k_nearest(points, sites, k)
+        choices = np.hstack([assign[:, None], choices])
+        dist = np.hstack([np.abs(points - sites[assign])[:, None], dist])
+
+        bonds = dist ** 2 if Tap.SQUARED else dist
+
+        # penalise bonds longer than max walking distance, like bond_energy
+        over = (limit[:, None] > 0) & (bonds > limit[:, None])
+        if over.any():
+            lim = np.broadcast_to(limit[:, None], bonds.shape)[over]
+            bonds[over] = penalised(bonds[over], lim)
+
+        fair = np.array([t.fairness(t.load) for t in taps])
+        cost = demand[:, None] * bonds * fair[choices]
+
+        new = cancel_cycles(choices, cost, len(taps))
+        moved = np.flatnonzero(new != assign)
+
+        if len(moved) == 0:
+            break
+
+        for i in moved.tolist():
+            houses[i].detach()
+            houses[i].attach(taps[new[i]])
+            houses[i].buff.insert(taps[new[i]])
+
+        for t in taps:
+            t.refresh()
+            t.centralise()
+            t.score()
+
+        new_energy = sum(t.energy for t in taps)
+
+        if new_energy >= energy:
+            restore(houses, taps, state)
+            break
+
+        energy = new_energy
+
+    return sum(a != b for a, b in zip(start, layout(houses, taps)[0]))
+
+
+def cancel_cycles(choices, cost, num_taps):
+    # Row i of choices holds the taps house i may use, its current tap
+    # first, and cost the cost of each. Builds the graph of taps with an
+    # edge t -> u for the cheapest move of a house from t to u and cancels
+    # negative cycles (see negative_cycle) until there are none. Returns
+    # the final tap of every house.
+    n, k = choices.shape
+    col = np.zeros(n, dtype=np.intp)
+    rows = np.arange(n)
+
+    house = np.repeat(rows, k)
+    target = choices.ravel()
+
+    while True:
+        assign = choices[rows, col]
+        own = cost[rows, col]
+
+        src = assign[house]
+        delta = (cost - own[:, None]).ravel()
+
+        valid = np.flatnonzero(src != target)
+
+        # the cheapest move along every edge
+        key = src[valid] * num_taps + target[valid]
+        order = np.lexsort((delta[valid], key))
+        key = key[order]
+        edges = valid[order][np.r_[True, key[1:] != key[:-1]]]
+
+        cancelled = 0
+
+        # edges out of a tap on a cancelled cycle are stale, the rest hold
+        # so further disjoint cycles are cancelled before rebuilding
+        while len(edges):
+            cycle = negative_cycle(
+                src[edges], target[edges], delta[edges], num_taps
+            )
+
+            if cycle is None or delta[edges[cycle]].sum() >= 0:
+                break
+
+            for e in edges[cycle].tolist():
+                col[house[e]] = e % k
+
+            cancelled += 1
+            edges = edges[~np.isin(src[edges], src[edges[cycle]])]
+
+        if cancelled == 0:
+            return assign
+
+
+def negative_cycle(src, dst, weight, num_nodes):
+    # Bellman-Ford from a virtual source joined to every node by a zero
+    # weight edge. Returns the indices of the edges of a negative weight
+    # cycle or None if there is none. A cycle among the predecessor edges
+    # is always negative so it is looked for after every pass.
+    tol = 1e-9 * max(np.abs(weight).mean(), 1e-300)
+
+    dist = np.zeros(num_nodes)
+    parent = np.full(num_nodes, -1)
+
+    for _ in range(num_nodes):
+        cand = dist[src] + weight
+
+        best = dist.copy()
+        np.minimum.at(best, dst, cand)
+
+        better = cand < dist[dst] - tol
+        better &= cand == best[dst]
+
+        if not better.any():
+            return None
+
+        parent[dst[better]] = np.flatnonzero(better)
+        dist = np.minimum(dist, best)
+
+        cycle = find_cycle(parent, src)
+
+        if cycle is not None:
+            return cycle
+
+    return None
+
+
+def find_cycle(parent, src):
+    # edges of a cycle in the graph of predecessor edges, or None
+    parent = parent.tolist()
+    src = src.tolist()
+    seen = [0] * len(parent)
+
+    for start in range(len(parent)):
+        node = start
+
+        while node >= 0 and not seen[node]:
+            seen[node] = start + 1
+            edge = parent[node]
+            node = src[edge] if edge >= 0 else -1
+
+        if node >= 0 and seen[node] == start + 1:
+            cycle = [parent[node]]
+
+            while src[cycle[-1]] != node:
+                cycle.append(parent[src[cycle[-1]]])
+
+            return cycle
+
+    return None
+
+
+def can_swap(h1, h2):
+    # False if swapping the taps of h1 and h2 provably can not lower the
+    # energy. With equal demands the loads are unchanged and bond energies
+    # grow with distance so if neither tap gains a house closer than the one
+    # it loses the swap is useless.
+    if h1.demand != h2.demand or h1.max_sq_dist != h2.max_sq_dist:
+        return True
+
+    t1 = h1.tap
+    t2 = h2.tap
+
+    return h2.sqdist(t1) < h1.sqdist(t1) or h1.sqdist(t2) < h2.sqdist(t2)
+
+
+def randomise(houses, taps, rng=random):
     # sets taps to random positions
     # assigns houses random tap
     # does not centralise taps
@@ -285,13 +1500,13 @@ def randomise(houses, taps):
     xmin, xmax, ymin, ymax = get_grid(houses)
 
     for t in taps:
-        t.pos = complex(random.uniform(xmin, xmax), random.uniform(ymin, ymax))
+        t.pos = complex(rng.uniform(xmin, xmax), rng.uniform(ymin, ymax))
 
     for h in houses:
         if h.tap is not None:
             h.detach()
 
-        tap = random.choice(taps)
+        tap = rng.choice(taps)
 
         h.attach(tap)
         h.buff.insert(tap)
@@ -324,44 +1539,124 @@ def calc_kB(houses, taps):
     return statistics.median(energy) * len(energy) / len(houses)
 
 
-def calc_scales(houses):
-    # finds the number of length scales in the village.
-    dists = []
-    for h in houses:
-        for o in houses:
-            if h is not o:
-                rel = h.dist(o)
-                if math.isclose(0, rel):
-                    print("WARNING - two houses very close:", rel)
-                else:
-                    dists.append(rel)
+def estimate_kB(houses, taps, rng=None, runs=KB_AVERAGE_RUNS):
+    # Vectorised equivalent of averaging calc_kB over runs calls to
+    # randomise, the layouts are never built. Returns the estimate and the
+    # half width of its KB_CONFIDENCE confidence interval.
+    rng = np.random.default_rng(rng)
 
-    mind = min(dists)
+    x = np.array([h.pos.real for h in houses])
+    y = np.array([h.pos.imag for h in houses])
+    demand = np.array([h.demand for h in houses])
+    max_sq_dist = np.array([h.max_sq_dist for h in houses])
 
-    dists = [math.log10(d / mind) for d in dists]
+    n, t = len(houses), len(taps)
+    exp_load = taps[0].exp_load
+    xmin, xmax, ymin, ymax = get_grid(houses)
 
-    maxd = int(math.ceil(max(dists)))
+    samples = []
+    rows = max(1, CHUNK_SIZE // n)
 
-    scales = [list() for _ in range(maxd)]
+    for start in range(0, runs, rows):
+        r = min(rows, runs - start)
 
-    for d in dists:
-        scales[int(math.floor(d))].append(d)
+        tap_x = rng.uniform(xmin, xmax, size=(r, t))
+        tap_y = rng.uniform(ymin, ymax, size=(r, t))
+        assign = rng.integers(t, size=(r, n))
 
-    expectation = len(houses) - 1
+        # flat (layout, tap) index of every bond
+        flat = assign + t * np.arange(r)[:, None]
 
-    num_scales = 0
-    for s in scales:
-        if len(s) >= expectation:
-            num_scales += 1
+        dx = x - tap_x.ravel()[flat]
+        dy = y - tap_y.ravel()[flat]
 
-    if num_scales < 2:
+        sqdist = dx * dx + dy * dy
+
+        if not Tap.SQUARED:
+            sqdist = np.sqrt(sqdist)
+
+        # penalise bonds longer than max walking distance
+        over = (max_sq_dist > 0) & (sqdist > max_sq_dist)
+        if over.any():
+            limit = np.broadcast_to(max_sq_dist, sqdist.shape)[over]
+            sqdist[over] = penalised(sqdist[over], limit)
+
+        flat = flat.ravel()
+        bonds = np.bincount(flat, sqdist.ravel() * np.tile(demand, r), r * t)
+        loads = np.bincount(flat, np.tile(demand, r), r * t)
+
+        fair = Tap.BASE ** (((loads - exp_load) / exp_load) ** 2)
+        energy = (bonds * fair).reshape(r, t)
+
+        samples.append(np.median(energy, axis=1) * t / n)
+
+    samples = np.concatenate(samples)
+
+    error = KB_CONFIDENCE * samples.std(ddof=1) / math.sqrt(len(samples))
+
+    return float(samples.mean()), float(error)
+
+
+def calc_scales(houses, sample_error=None, rng=None):
+    # finds the number of length scales in the village. A length scale is a
+    # decade of pair distances (relative to the smallest) containing at least
+    # as many pairs as there are houses. If sample_error is given the decade
+    # counts are estimated from random pairs to within that relative error
+    # (with probability SAMPLE_CONFIDENCE) rather than counted exactly.
+    points = [h.pos for h in houses]
+    n = len(points)
+
+    if n < 2:
         return 2
+
+    pairs = n * (n - 1) // 2
+    samples = None
+
+    if sample_error is not None:
+        # multiplicative Chernoff bound at the threshold frequency of 1 / n
+        # for every decade, 16 decades covers any realistic village.
+        samples = 3 * n * math.log(2 * 16 / (1 - SAMPLE_CONFIDENCE))
+        samples = int(math.ceil(samples / sample_error ** 2))
+
+        if samples >= pairs:
+            samples = None
+
+    if samples is None:
+        mind = math.inf
+        for d in pair_distances(points):
+            d = d[d > 0]
+            if len(d):
+                mind = min(mind, d.min())
+
+        chunks = pair_distances(points)
+        total = pairs
     else:
-        return num_scales
+        mind = min_separation(points)
+        chunks = sample_distances(points, samples, np.random.default_rng(rng))
+        total = samples
 
+    counts = np.zeros(0, dtype=np.int64)
+    close = 0
 
-def find_tap_index(house, taps):
-    # finds index of house's tap in taps
-    for c, tap in enumerate(taps):
-        if tap is house.tap:
-            return c
+    for d in chunks:
+        zero = d == 0
+        close += np.count_nonzero(zero)
+
+        d = np.floor(np.log10(d[~zero] / mind)).astype(np.int64)
+        d = np.bincount(d, minlength=len(counts))
+
+        d[: len(counts)] += counts
+        counts = d
+
+    if close > 0:
+        log.warning("%d pairs of houses very close", close * pairs // total)
+
+    # ordered pairs were counted as a scale needs n - 1 of them
+    expectation = (n - 1) * total / (2 * pairs)
+
+    num_scales = np.count_nonzero(counts >= expectation)
+
+    if num_scales < 2:
+        return 2
+    else:
+        return int(num_scales)
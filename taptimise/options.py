@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.options: command line options shared by main and batch."""
+
+from .optimise import FAIRNESS
+
+
+def add_village_options(parser, taps=None):
+    # Adds the options that control the optimisation of a village to parser.
+    # The tap capacity and number of taps go in taps, if given, so the
+    # single village CLI can make them a required exclusive group.
+    if taps is None:
+        taps = parser
+
+    taps.add_argument(
+        "-t",
+        "--tap-capacity",
+        type=float,
+        action="store",
+        metavar="CAP",
+        help="Maximum load a single tap can support.",
+    )
+    taps.add_argument(
+        "-N",
+        "--num-taps",
+        type=int,
+        action="store",
+        help="Set the number of taps to start with.",
+        metavar="NUM",
+    )
+    parser.add_argument(
+        "-m",
+        "--max-distance",
+        type=float,
+        default=-1,
+        help="Maximum house-tap distance.",
+        action="store",
+        metavar="DIST",
+    )
+    parser.add_argument(
+        "-b",
+        "--buffer-size",
+        type=int,
+        action="store",
+        help="Size of each houses internal buffer.",
+        metavar="SIZE",
+    )
+    parser.add_argument(
+        "-f",
+        "--fairness",
+        type=int,
+        action="store",
+        default=FAIRNESS,
+        help="Higher equals flatter load distibution but longer walking distances. On interval 1-1000000.",
+        metavar="FAIR",
+    )
+    parser.add_argument(
+        "-s",
+        "--steps",
+        action="store",
+        type=int,
+        help="Number of Monte-Carlo cooling steps per scale per tap.",
+    )
+    parser.add_argument(
+        "--scribble",
+        action="store",
+        metavar="DEMAND",
+        type=float,
+        help="Set parser for scribble maps file argument is per house demand.",
+    )
+    parser.add_argument(
+        "--scales",
+        action="store",
+        type=int,
+        help="Set number of scales, leave blank for automatic detection.",
+    )
+    parser.add_argument(
+        "--scale-error",
+        action="store",
+        type=float,
+        metavar="ERR",
+        help="Estimate length scales from sampled pairs to this relative error.",
+    )
+    parser.add_argument(
+        "--engine",
+        action="store",
+        choices=["object", "numpy"],
+        default="object",
+        help="Energy engine, numpy is faster when taps serve many houses.",
+    )
+    parser.add_argument(
+        "--energy",
+        action="store",
+        choices=["distance", "squared"],
+        default="distance",
+        help="Bond energy, squared enables O(1) move evaluation.",
+    )
+    parser.add_argument(
+        "--proposal",
+        action="store",
+        choices=["buffer", "nearest"],
+        default="buffer",
+        help="Propose moves to buffered taps or the nearest taps.",
+    )
+    parser.add_argument(
+        "--init",
+        action="store",
+        choices=["random", "kmeans"],
+        default="random",
+        help="Starting layout, kmeans starts from balanced clusters.",
+    )
+    parser.add_argument(
+        "--schedule",
+        action="store",
+        choices=["geometric", "adaptive", "tempering"],
+        default="geometric",
+        help="Cooling schedule, adaptive follows the acceptance rate and "
+        "stops once converged, tempering runs parallel replica exchange.",
+    )
+    parser.add_argument(
+        "--chains",
+        action="store",
+        type=int,
+        metavar="M",
+        help="Number of parallel tempering chains, defaults to more for "
+        "bigger villages.",
+    )
+    parser.add_argument(
+        "--replicas",
+        action="store",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run N independent annealers and keep the best.",
+    )
+    parser.add_argument(
+        "--workers",
+        action="store",
+        type=int,
+        metavar="W",
+        help="Number of processes for replicas or chains, defaults to all cores.",
+    )
+    parser.add_argument(
+        "--clusters",
+        action="store",
+        type=int,
+        metavar="K",
+        help="Split large villages into K clusters optimised in parallel.",
+    )
+    parser.add_argument(
+        "--seed",
+        action="store",
+        type=int,
+        help="Seed the random number generator for a reproducible run.",
+    )
+    parser.add_argument(
+        "--relax",
+        action="store",
+        choices=["full", "nearest", "flow"],
+        default="full",
+        help="Pair relaxation, nearest only tries nearby houses, flow "
+        "reassigns houses by min cost flow.",
+    )
+    parser.add_argument(
+        "--no-relax",
+        action="store_true",
+        help="Disables extra relaxation optimisation.",
+    )
+    parser.add_argument(
+        "--no-auto",
+        action="store_true",
+        help="Disables automatic reruns when max house-tap separation too large.",
+    )
+    parser.add_argument(
+        "--search",
+        action="store",
+        choices=["linear", "gallop"],
+        default="linear",
+        help="How automatic reruns search for the number of taps.",
+    )
+
+
+def village_options(args):
+    # keyword arguments of optimise (and fewest_taps) given by the options
+    # of add_village_options
+    return dict(
+        num_taps=args.num_taps,
+        steps=args.steps,
+        multiscale=args.scales,
+        max_dist=args.max_distance,
+        buff_size=args.buffer_size,
+        norelax=args.no_relax,
+        fair=args.fairness,
+        engine=args.engine,
+        energy=args.energy,
+        relax_mode=args.relax,
+        scale_error=args.scale_error,
+        replicas=args.replicas,
+        workers=args.workers,
+        schedule=args.schedule,
+        chains=args.chains,
+        seed=args.seed,
+        proposal=args.proposal,
+        init=args.init,
+        clusters=args.clusters,
+    )
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.report: writes the html report of a run."""
+
+import csv
+import os
+import statistics
+import sys
+from decimal import Decimal
+
+import numpy as np
+
+from .__init__ import __version__
+from .htmltable import write_html
+
+LIGHT_HOUSES = 5000  # villages with more houses get a light report by default
+LONGEST_WALKS = 50  # houses listed in a light report
+
+# suffixes of the files written next to a village, <stem><suffix>
+TAPS_CSV = "_taps.csv"
+TAPS_KML = "_taps.kml"
+HOUSES_CSV = "_houses.csv"
+REPORT_HTML = "_report.html"
+CHECKPOINT_NPZ = "_checkpoint.npz"
+OUTPUT_SUFFIXES = (TAPS_CSV, TAPS_KML, HOUSES_CSV, REPORT_HTML, CHECKPOINT_NPZ)
+
+STYLE = """
+    <style>
+    .center_svg {
+        display: block;
+        margin-left: auto;
+        margin-right: auto;}
+
+    .center_txt {
+        display: block;
+        margin-left: auto;
+        margin-right: auto;
+        width: 80vmin;}
+
+    h1{font-size:50px;}
+    h2{font-size:40px;}
+    p{font-size:20px;}
+
+    table {
+            border-collapse: collapse;
+            width: 100%;}
+
+    td, th {
+            font-size:20px;
+            border: 1px solid #dddddd;
+            text-align: left;
+            padding: 8px;}
+
+    tr:nth-child(even) {
+            background-color: #dddddd;}
+
+    table th {
+        background-color: black;
+        color: white;}
+
+    </style>
+"""
+
+
+def write_report(stem, name, result, map_svg, debug_svg, light=False):
+    # Writes the report of result (with lat, lon rows) to stem_report.html
+    # section by section, so the document is never held in memory. A light
+    # report only lists the LONGEST_WALKS houses furthest from their taps
+    # and a summary of the walks, every house is written to the sidecar
+    # stem_houses.csv instead. Returns the path of the report.
+    houses, taps, max_dist, _, energy, _ = result
+    path = stem + REPORT_HTML
+
+    with open(path, "w") as f:
+        f.write(
+            f"""
+    <!DOCTYPE html>
+    <html>
+
+    <head>
+    <title> Taptimise {name.upper()} Report </title>
+    </head>
+    {STYLE}
+    <body>
+
+    <div class="center_txt">
+
+    <h1 align="center">Taptimise Report - Village: {name.upper()}</h1>
+
+    <p> This report has been generated using Taptimise the tap positioning
+        Monte-Carlo-Annealing optimiser. For more information and bug reporting
+        visit <a href="https://github.com/ConorWilliams/taptimise">GitHub</a>.
+        </p>
+
+    <p> Copyright 2019 C. J. Williams (CHURCHILL COLLEGE). Taptimise is free
+        (open-source) software with ABSOLUTELY NO WARRANTY, distibuted under the
+        MIT license.
+        </p>
+
+    <p> The arguments & flags given to produce this report where:
+        "{' '.join(sys.argv[1:])}" running Taptimise version {__version__}.
+        </p>
+
+    <p> Taptimise placed <b>{len(taps)} taps</b>. The furthest tap-house separation was
+        <b>{'{:g}'.format(float('{:.{p}g}'.format(max_dist, p=3)))} meters</b>.
+        The final energy of the village was <b>{Decimal(energy):.2E}
+        units </b>. A summery of the tap loads are:
+        {', '.join(str(tap[3]) for tap in taps)}. With a mean of
+        <b>{round(statistics.mean(t[3] for t in taps))} ±
+        {round(statistics.pstdev(t[3] for t in taps))}</b>.
+        </p>
+
+    <h2>Village Map</h2>
+
+    </div>
+"""
+        )
+
+        f.write('\n    <div class="center_svg">\n')
+        f.write(map_svg)
+        f.write("\n    </div>\n")
+
+        f.write(
+            '\n    <div class="center_txt">\n    <h2>Annealing Data</h2>\n'
+        )
+        f.write('    </div>\n\n    <div class="center_svg">\n')
+
+        for svg in debug_svg:
+            f.write(svg)
+
+        f.write("\n    </div>\n")
+
+        f.write('\n    <div class="center_txt">\n    <h2>Tap Data</h2>\n')
+        write_html(f, ["Latitude", "Longitude", "Number", "Load"], taps)
+        f.write("\n    <h2>House Data</h2>\n")
+
+        header = ["Latitude", "Longitude", "Tap Number", "Separation/m"]
+
+        if light:
+            sidecar = write_houses(stem, houses)
+            walks = np.array([h[3] for h in houses], dtype=float)
+            longest = sorted(houses, key=lambda h: -h[3])[:LONGEST_WALKS]
+
+            f.write(
+                f"""
+    <p> The walks of the {len(houses)} houses have a mean of
+        <b>{walks.mean():.0f} meters</b>, a median of
+        {np.median(walks):.0f}, a 90th percentile of
+        {np.percentile(walks, 90):.0f} and a maximum of {walks.max():.0f}.
+        Every house is listed in
+        <a href="{os.path.basename(sidecar)}">{os.path.basename(sidecar)}</a>,
+        the {len(longest)} longest walks are:
+        </p>
+"""
+            )
+
+            write_html(f, header, longest)
+        else:
+            write_html(f, header, houses)
+
+        f.write("\n    </div>\n\n\n    </body>\n    </html>")
+
+    return path
+
+
+def to_geo(rows, convert):
+    # converts x, y, index, value rows of a result (its taps or houses) in
+    # place to lat, lon, index, int(value) rows, convert is the LocalXY of
+    # the village
+    xy = np.array([r[0:2] for r in rows], dtype=float).reshape(-1, 2)
+    lat, lon = convert.enu2geo(xy[:, 0], xy[:, 1])
+
+    for r, r_lat, r_lon in zip(rows, lat.tolist(), lon.tolist()):
+        r[0], r[1], r[3] = r_lat, r_lon, int(r[3])
+
+
+def write_taps(stem, taps):
+    # writes the lat, lon of every tap to stem_taps.csv, returns its path
+    path = stem + TAPS_CSV
+
+    with open(path, "w") as f:
+        for t in taps:
+            print(f"{round(t[0], 5)},{round(t[1], 5)}", file=f)
+
+    return path
+
+
+def write_houses(stem, houses):
+    # writes the house rows to stem_houses.csv, returns its path
+    path = stem + HOUSES_CSV
+
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["latitude", "longitude", "tap", "walk"])
+        writer.writerows(houses)
+
+    return path
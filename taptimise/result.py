@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+"""taptimise.result: the result of an optimisation."""
+
+from typing import NamedTuple
+
+
+class Result(NamedTuple):
+    # Returned by optimise, still unpacks like the plain 6-tuple it replaces.
+    # houses are [x, y, tap index, walk] rows, taps are [x, y, index, load]
+    # rows, history is the cooling data of a debug run and stats holds the
+    # seed, kB, times and any mode specific statistics.
+    houses: list
+    taps: list
+    max_dist: float
+    history: list
+    energy: float
+    stats: dict
+
+    @property
+    def positions(self):
+        # (x, y) of every tap
+        return [(t[0], t[1]) for t in self.taps]
+
+    @property
+    def assignments(self):
+        # tap index of every house
+        return [h[2] for h in self.houses]
+
+    @property
+    def loads(self):
+        # total demand of every tap
+        return [t[3] for t in self.taps]
+
+    @property
+    def walks(self):
+        # distance from every house to its tap
+        return [h[3] for h in self.houses]
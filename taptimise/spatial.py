@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+
+import math
+
+import numpy as np
+
+CELL_OCCUPANCY = 2  # average number of points per grid cell
+CHUNK_SIZE = 2 ** 20  # maximum number of pair distances held at once
+KMEANS_ITERS = 50  # maximum number of Lloyd iterations
+BALANCE_ITERS = 5  # maximum number of capacity constrained iterations
+BALANCE_CHOICES = 8  # nearest centres a point may be balanced onto
+
+
+class Grid:
+    # Uniform bucket grid over a set of 2D points (complex numbers) for
+    # nearest neighbour queries. Points can be moved after construction.
+    def __init__(self, points, occupancy=CELL_OCCUPANCY):
+        self.points = list(points)
+
+        x = [p.real for p in self.points]
+        y = [p.imag for p in self.points]
+
+        self.xmin, self.ymin = min(x), min(y)
+
+        gap = max(max(x) - self.xmin, max(y) - self.ymin)
+        side = max(1, int(math.sqrt(len(self.points) / occupancy)))
+
+        self.side = side
+        self.width = gap / side if gap > 0 else 1.0
+
+        self.cells = {}
+        self.keys = []
+        self.bounds = [0, side, 0, side]
+
+        for i, p in enumerate(self.points):
+            key = self.key(p)
+            self.keys.append(key)
+            self.cells.setdefault(key, []).append(i)
+
+    def key(self, p):
+        i = int((p.real - self.xmin) // self.width)
+        j = int((p.imag - self.ymin) // self.width)
+        return i, j
+
+    def move(self, i, p):
+        # updates the position of point i
+        self.points[i] = p
+        key = self.key(p)
+
+        if key != self.keys[i]:
+            self.cells[self.keys[i]].remove(i)
+            self.cells.setdefault(key, []).append(i)
+            self.keys[i] = key
+
+            # points may leave the original box
+            b = self.bounds
+            b[0], b[1] = min(b[0], key[0]), max(b[1], key[0])
+            b[2], b[3] = min(b[2], key[1]), max(b[3], key[1])
+
+    def ring(self, key, r):
+        # yields the indices in the cells exactly r cells from key
+        ci, cj = key
+        cells = self.cells
+
+        if r == 0:
+            yield from cells.get(key, ())
+            return
+
+        for i in range(ci - r, ci + r + 1):
+            yield from cells.get((i, cj - r), ())
+            yield from cells.get((i, cj + r), ())
+
+        for j in range(cj - r + 1, cj + r):
+            yield from cells.get((ci - r, j), ())
+            yield from cells.get((ci + r, j), ())
+
+    def knn(self, p, k, exclude=None):
+        # returns the indices of the k points nearest to p sorted by distance
+        key = self.key(p)
+        found = []
+        r = 0
+
+        # after scanning r rings every point within r * width + edge of p is
+        # found, edge is the distance from p to the boundary of its cell
+        fx = (p.real - self.xmin) / self.width - key[0]
+        fy = (p.imag - self.ymin) / self.width - key[1]
+        edge = min(fx, 1 - fx, fy, 1 - fy) * self.width
+
+        imin, imax, jmin, jmax = self.bounds
+        reach = max(
+            key[0] - imin, imax - key[0], key[1] - jmin, jmax - key[1], 0
+        )
+
+        points = self.points
+
+        def dist(i):
+            return abs(points[i] - p)
+
+        while r <= reach:
+            found.extend(i for i in self.ring(key, r) if i != exclude)
+
+            if len(found) >= k:
+                found.sort(key=dist)
+
+                if dist(found[k - 1]) <= r * self.width + edge:
+                    return found[:k]
+
+            r += 1
+
+        found.sort(key=dist)
+
+        return found[:k]
+
+
+def pair_distances(points, chunk=CHUNK_SIZE):
+    # yields arrays of the distances between all unordered pairs of points
+    # (complex numbers) without ever holding more than ~chunk of them.
+    points = np.asarray(points, dtype=complex)
+    n = len(points)
+
+    rows = max(1, chunk // max(n, 1))
+
+    for start in range(0, n - 1, rows):
+        stop = min(start + rows, n - 1)
+
+        block = points[start:stop, None] - points[None, start + 1 :]
+        dist = np.abs(block)
+
+        # keep only the upper triangle, column c is point start + 1 + c
+        i = np.arange(stop - start)[:, None]
+        j = np.arange(n - start - 1)[None, :]
+
+        yield dist[j >= i]
+
+
+def sample_distances(points, samples, rng, chunk=CHUNK_SIZE):
+    # yields arrays of the distances between uniformly sampled ordered pairs
+    # of distinct points.
+    points = np.asarray(points, dtype=complex)
+    n = len(points)
+
+    while samples > 0:
+        m = min(samples, chunk)
+        samples -= m
+
+        i = rng.integers(n, size=m)
+        j = rng.integers(n - 1, size=m)
+        j += j >= i
+
+        yield np.abs(points[i] - points[j])
+
+
+def min_separation(points):
+    # smallest non-zero distance between two points using the grid to find
+    # each points nearest distinct neighbour.
+    unique = np.unique(np.asarray(list(points), dtype=complex))
+
+    if len(unique) < 2:
+        return 0
+
+    grid = Grid(unique)
+
+    return min(
+        abs(unique[grid.knn(p, 1, exclude=i)[0]] - p)
+        for i, p in enumerate(unique)
+    )
+
+
+def nearest(points, sites, chunk=CHUNK_SIZE):
+    # index of and distance to the nearest site for every point (complex
+    # numbers) by brute force in chunks, fast for a moderate number of sites
+    points = np.asarray(points, dtype=complex)
+    sites = np.asarray(sites, dtype=complex)
+
+    index = np.empty(len(points), dtype=np.intp)
+    dist = np.empty(len(points))
+
+    rows = max(1, chunk // max(len(sites), 1))
+
+    for start in range(0, len(points), rows):
+        block = np.abs(points[start : start + rows, None] - sites[None, :])
+        index[start : start + rows] = block.argmin(axis=1)
+        dist[start : start + rows] = block.min(axis=1)
+
+    return index, dist
+
+
+def kmeans(points, k, rng, weights=None, iters=KMEANS_ITERS, capacity=None):
+    # Weighted k-means of points (complex numbers) seeded by k-means++.
+    # Returns the k centres and the index of the centre of each point. If
+    # capacity is given the clusters are then balanced so none holds more
+    # than capacity weight where possible (see balanced).
+    points = np.asarray(points, dtype=complex)
+    n = len(points)
+
+    if weights is None:
+        weights = np.ones(n)
+    else:
+        weights = np.asarray(weights, dtype=float)
+
+    # k-means++, each centre is drawn with probability proportional to its
+    # weight times its squared distance from the centres so far
+    centres = np.empty(k, dtype=complex)
+    centres[0] = points[rng.choice(n, p=weights / weights.sum())]
+    sq_dist = np.abs(points - centres[0]) ** 2
+
+    for c in range(1, k):
+        p = weights * sq_dist
+        total = p.sum()
+
+        i = rng.choice(n, p=p / total) if total > 0 else rng.integers(n)
+        centres[c] = points[i]
+
+        sq_dist = np.minimum(sq_dist, np.abs(points - centres[c]) ** 2)
+
+    # Lloyd's algorithm, empty clusters keep their centre
+    for _ in range(iters):
+        index, _ = nearest(points, centres)
+        new = centroids(points, weights, index, centres)
+
+        if np.array_equal(new, centres):
+            break
+
+        centres = new
+
+    if capacity is None:
+        index, _ = nearest(points, centres)
+        return centres, index
+
+    # the same with capacity constrained assignments
+    for _ in range(BALANCE_ITERS):
+        index = balanced(points, centres, capacity, weights)
+        new = centroids(points, weights, index, centres)
+
+        if np.array_equal(new, centres):
+            break
+
+        centres = new
+
+    return centres, balanced(points, centres, capacity, weights)
+
+
+def centroids(points, weights, index, centres):
+    # weighted mean of the points of every centre, empty ones stay put
+    k = len(centres)
+
+    mass = np.bincount(index, weights, minlength=k)
+    moment = np.bincount(index, weights * points.real, minlength=k)
+    moment = moment + 1j * np.bincount(
+        index, weights * points.imag, minlength=k
+    )
+
+    return np.where(mass > 0, moment / np.maximum(mass, 1e-300), centres)
+
+
+def balanced(points, centres, capacity, weights, k=BALANCE_CHOICES):
+    # Assigns every point to the nearest of its k nearest centres with room
+    # for its weight. Points that lose most by missing their nearest centre
+    # choose first and a point whose k centres are all full goes to the
+    # least loaded of them. Returns the centre index of every point.
+    choices, dist = k_nearest(points, centres, k)
+
+    if choices.shape[1] > 1:
+        regret = dist[:, 1] - dist[:, 0]
+    else:
+        regret = np.zeros(len(points))
+
+    load = [0.0] * len(centres)
+    index = np.empty(len(points), dtype=np.intp)
+    weights = weights.tolist()
+    choices = choices.tolist()
+
+    for p in np.argsort(-regret, kind="stable").tolist():
+        w = weights[p]
+        options = choices[p]
+
+        for c in options:
+            if load[c] + w <= capacity:
+                break
+        else:
+            c = min(options, key=load.__getitem__)
+
+        index[p] = c
+        load[c] += w
+
+    return index
+
+
+def k_nearest(points, sites, k, chunk=CHUNK_SIZE):
+    # indices of and distances to the k nearest sites of every point sorted
+    # by distance, by brute force in chunks like nearest
+    points = np.asarray(points, dtype=complex)
+    sites = np.asarray(sites, dtype=complex)
+    k = min(k, len(sites))
+
+    index = np.empty((len(points), k), dtype=np.intp)
+    dist = np.empty((len(points), k))
+
+    rows = max(1, chunk // max(len(sites), 1))
+
+    for start in range(0, len(points), rows):
+        block = np.abs(points[start : start + rows, None] - sites[None, :])
+
+        if k < len(sites):
+            part = np.argpartition(block, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(k), block.shape)
+
+        near = np.take_along_axis(block, part, axis=1)
+        order = near.argsort(axis=1)
+
+        index[start : start + rows] = np.take_along_axis(part, order, axis=1)
+        dist[start : start + rows] = np.take_along_axis(near, order, axis=1)
+
+    return index, dist
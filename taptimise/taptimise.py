@@ -3,23 +3,31 @@
 """taptimise.taptimise: provides entry point main()."""
 
 import argparse
-import csv
 import os
 import io
+import logging
 import sys
-import statistics
 from decimal import Decimal
+from contextlib import redirect_stdout, redirect_stderr
 
-import simplekml
 import numpy as np
-from pyfiglet import Figlet
-from matplotlib import pyplot as plt
 
+# matplotlib, pyfiglet and simplekml are slow to import so are only imported
+# when the report, banner or kml are produced
 
 from .__init__ import __version__
-from .optimise import optimise
-from .htmltable import to_html
-from .units import LocalXY
+from .optimise import optimise, fewest_taps
+from .events import JsonLines, Profiler
+from .options import add_village_options, village_options
+from .report import (
+    write_report,
+    write_taps,
+    to_geo,
+    LIGHT_HOUSES,
+    TAPS_KML,
+    CHECKPOINT_NPZ,
+)
+from .ingest import load_village
 
 WINDOW_SIZE = 3  # must be an odd number
 
@@ -57,11 +65,19 @@ def save_svg(fig):
     return svg
 
 
-def formatter(prog):
-    return argparse.HelpFormatter(prog, max_help_position=52)
+class Echo(logging.Handler):
+    # prints log records to the current stdout, so --quiet and
+    # redirect_stdout silence them like any other output
+    def emit(self, record):
+        if record.levelno >= logging.WARNING:
+            print(f"{record.levelname} -", record.getMessage())
+        else:
+            print(record.getMessage())
 
 
-def main():
+def banner():
+    from pyfiglet import Figlet
+
     custom_fig = Figlet(font="graffiti")
     print(custom_fig.renderText("Taptimise"))
     print("Tap placement optimiser with Monte-Carlo-Annealer")
@@ -69,167 +85,12 @@ def main():
     print("This is free software with ABSOLUTELY NO WARRANTY")
     print()
 
-    # ****************************************************************************
-    # *                              Parse Arguments                             *
-    # ****************************************************************************
-
-    parser = argparse.ArgumentParser(formatter_class=formatter)
-    group = parser.add_mutually_exclusive_group(required=True)
-
-    parser.add_argument("path", help="Path to house data.")  # positional
-
-    parser.add_argument(
-        "-V", "--version", action="version", version="%(prog)s " + __version__
-    )
-    group.add_argument(
-        "-t",
-        "--tap-capacity",
-        type=float,
-        action="store",
-        metavar="CAP",
-        help="Maximum load a single tap can support.",
-    )
-    group.add_argument(
-        "-N",
-        "--num-taps",
-        type=int,
-        action="store",
-        help="Set the number of taps to start with.",
-        metavar="NUM",
-    )
-    parser.add_argument(
-        "-m",
-        "--max-distance",
-        type=float,
-        default=-1,
-        help="Maximum house-tap distance.",
-        action="store",
-        metavar="DIST",
-    )
-    parser.add_argument(
-        "-b",
-        "--buffer-size",
-        type=int,
-        action="store",
-        help="Size of each houses internal buffer.",
-        metavar="SIZE",
-    )
-    parser.add_argument(
-        "-f",
-        "--fairness",
-        type=int,
-        action="store",
-        default=50,
-        help="Higher equals flatter load distibution but longer walking distances. On interval 1-1000000.",
-        metavar="FAIR",
-    )
-    parser.add_argument(
-        "-s",
-        "--steps",
-        action="store",
-        type=int,
-        help="Number of Monte-Carlo cooling steps per scale per tap.",
-    )
-    parser.add_argument(
-        "--scribble",
-        action="store",
-        metavar="DEMAND",
-        type=float,
-        help="Set parser for scribble maps file argument is per house demand.",
-    )
-    parser.add_argument(
-        "--scales",
-        action="store",
-        type=int,
-        help="Set number of scales, leave blank for automatic detection.",
-    )
-    parser.add_argument(
-        "--csv", action="store_true", help="Write results to a .csv file."
-    )
-    parser.add_argument(
-        "--kml", action="store_true", help="Write results to a .kml file."
-    )
-    parser.add_argument(
-        "--no-relax",
-        action="store_true",
-        help="Disables extra relaxation optimisation.",
-    )
-    parser.add_argument(
-        "--no-auto",
-        action="store_true",
-        help="Disables automatic reruns when max house-tap separation too large.",
-    )
-    parser.add_argument(
-        "--no-debug", action="store_false", help="Disable debugging graphs."
-    )
-
-    args = parser.parse_args()
-
-    if os.path.isabs(args.path):
-        path = os.path.normpath(args.path)
-    else:
-        path = os.path.abspath(args.path)
-
-    # ****************************************************************************
-    # *                             Run Optimisation                             *
-    # ****************************************************************************
-
-    raw_houses = []
-
-    with open(path, newline="", encoding="utf-8-sig") as f:
-        reader = csv.reader(f)
-        if args.scribble is not None:
-            for row in reader:
-                try:
-                    if row[0] == "Marker":
-                        raw_houses.append(
-                            [float(row[4]), float(row[5]), float(args.scribble)]
-                        )
-                except:
-                    print("Can't read", row)
-        else:
-            for row in reader:
-                try:
-                    raw_houses.append([float(elem) for elem in row])
-                except:
-                    print("Can't read", row)
-
-    convert = LocalXY(*raw_houses[0][0:2])
-
-    for h in raw_houses:
-        h[0], h[1] = convert.geo2enu(h[0], h[1])
-
-    if args.tap_capacity is None:
-        args.tap_capacity = sum(h[2] for h in raw_houses) / args.num_taps
-
-    max_dist = args.max_distance + 1
-    num_taps = args.num_taps
-
-    while max_dist > args.max_distance:
-        houses, taps, max_dist, run_data, energy = optimise(
-            raw_houses,
-            args.tap_capacity,
-            num_taps=num_taps,
-            steps=args.steps,
-            debug=args.no_debug,
-            multiscale=args.scales,
-            max_dist=args.max_distance,
-            buff_size=args.buffer_size,
-            norelax=args.no_relax,
-            fair=args.fairness,
-        )
-        num_taps = len(taps) + 1
 
-        print()
-
-        if args.no_auto or args.max_distance < 0:
-            break
-
-    # ****************************************************************************
-    # *                               Plot Village                               *
-    # ****************************************************************************
-
-    name = os.path.basename(args.path)[:-4]
+def plot_village(houses, taps, name, rasterized=False):
+    # map of the houses coloured by tap, returned as an svg string. If
+    # rasterized the houses are embedded as an image rather than a vector
+    # element per house.
+    from matplotlib import pyplot as plt
 
     cmap = plt.cm.get_cmap("nipy_spectral", len(taps))
 
@@ -238,7 +99,15 @@ def main():
 
     fig, ax = plt.subplots(figsize=(6, 6))
 
-    ax.scatter(h[::, 0], h[::, 1], c=h[::, 2], cmap=cmap, label="Houses", s=4)
+    ax.scatter(
+        h[::, 0],
+        h[::, 1],
+        c=h[::, 2],
+        cmap=cmap,
+        label="Houses",
+        s=4,
+        rasterized=rasterized,
+    )
     ax.plot(t[:, 0], t[:, 1], "+", color="k", markersize=8, label="Taps")
 
     ax.set_title(f"{name.upper()} - {len(taps)} Taps")
@@ -265,210 +134,321 @@ def main():
 
     fig.tight_layout()
 
-    map_svg = save_svg(fig)
+    return save_svg(fig)
 
-    # ****************************************************************************
-    # *                                Plot Debug                                *
-    # ****************************************************************************
 
-    debug_svg = []
+def plot_debug(run_data, num_houses, rasterized=False):
+    # cooling curve of every run, returned as a list of svg strings, the
+    # curves are embedded as images if rasterized
+    from matplotlib import pyplot as plt
+
+    svgs = []
+
+    for order, curve in enumerate(run_data):
 
-    if args.no_debug:
+        fig, ax = plt.subplots()
 
-        width = 1
+        data = np.asarray(curve)
+        ind = np.arange(len(curve))
 
-        E0 = run_data[0][0][1]
+        counts = data[::, 2:5:1] * 100 / num_houses
 
-        for order, run in enumerate(run_data):
+        counts[::, 1] += counts[::, 0]
+        counts[::, 2] += counts[::, 1]
 
-            fig, ax = plt.subplots()
+        counts[::, 0] = smooth(counts[::, 0])
+        counts[::, 1] = smooth(counts[::, 1])
 
-            data = np.asarray(run)
-            ind = np.arange(len(run))
+        ax.set_xlabel("Monte-Carlo Steps")
+        ax.set_ylabel("Percentage Count")
+        ax.set_title(f"Cooling Curve")
 
-            counts = data[::, 2:5:1] * 100 / len(houses)
+        ax.fill_between(
+            ind,
+            counts[::, 0],
+            label="Favourable",
+            color="mediumseagreen",
+            rasterized=rasterized,
+        )
+        ax.fill_between(
+            ind,
+            counts[::, 0],
+            counts[::, 1],
+            label="Unfavourable-accepted",
+            color="indianred",
+            rasterized=rasterized,
+        )
+        ax.fill_between(
+            ind,
+            counts[::, 1],
+            counts[::, 2],
+            label="Unfavourable-rejected",
+            color="steelblue",
+            rasterized=rasterized,
+        )
+        ax.fill_between(
+            ind,
+            counts[::, 2],
+            100,
+            label="Quantum-tunnel",
+            color="orchid",
+            rasterized=rasterized,
+        )
 
-            counts[::, 1] += counts[::, 0]
-            counts[::, 2] += counts[::, 1]
+        ax.set_xlim(ind[0], ind[-1])
+        ax.set_ylim(bottom=0)
+        ax.legend(loc="center right")
 
-            counts[::, 0] = smooth(counts[::, 0])
-            counts[::, 1] = smooth(counts[::, 1])
+        ax2 = ax.twinx()
 
-            ax.set_xlabel("Monte-Carlo Steps")
-            ax.set_ylabel("Percentage Count")
-            ax.set_title(f"Cooling Curve")
+        ax2.set_ylabel("Relative Energy")
+        ax2.plot(ind, smooth(data[::, 1]), color="k", rasterized=rasterized)
 
-            ax.fill_between(
-                ind, counts[::, 0], label="Favourable", color="mediumseagreen"
-            )
-            ax.fill_between(
-                ind,
-                counts[::, 0],
-                counts[::, 1],
-                label="Unfavourable-accepted",
-                color="indianred",
-            )
-            ax.fill_between(
-                ind,
-                counts[::, 1],
-                counts[::, 2],
-                label="Unfavourable-rejected",
-                color="steelblue",
-            )
-            ax.fill_between(
-                ind, counts[::, 2], 100, label="Quantum-tunnel", color="orchid"
+        fig.tight_layout()
+
+        svg = save_svg(fig)
+
+        svgs.append(svg)
+
+    return svgs
+
+
+def run(args, raw_houses):
+    # runs the optimiser chosen by the command line arguments and prints a
+    # summary of its statistics
+    if args.tap_capacity is None:
+        args.tap_capacity = sum(h[2] for h in raw_houses) / args.num_taps
+
+    options = dict(
+        village_options(args),
+        debug=args.no_debug and not args.quiet,
+        progress_bar=not args.quiet,
+    )
+
+    if args.checkpoint or args.resume:
+        stem = os.path.abspath(args.path)[:-4]
+        options["checkpoint"] = stem + CHECKPOINT_NPZ
+        options["resume"] = args.resume
+
+    log = JsonLines(args.events) if args.events else None
+
+    if args.profile or args.memory:
+        options["events"] = Profiler(log, args.profile, args.memory)
+    else:
+        options["events"] = log
+
+    try:
+        if args.no_auto or args.max_distance < 0:
+            result = optimise(raw_houses, args.tap_capacity, **options)
+        else:
+            result = fewest_taps(
+                raw_houses,
+                args.tap_capacity,
+                search=args.search,
+                **options,
             )
+    finally:
+        if log is not None:
+            log.close()
 
-            ax.set_xlim(ind[0], ind[-1])
-            ax.set_ylim(bottom=0)
-            ax.legend(loc="center right")
+    stats = result[5]
 
-            ax2 = ax.twinx()
+    print("Random seed:", stats["seed"])
 
-            ax2.set_ylabel("Relative Energy")
-            ax2.plot(ind, smooth(data[::, 1]), color="k")
+    if "kB_error" in stats:
+        print(f"Estimated kB: {stats['kB']:.4g} ± {stats['kB_error']:.2g}")
 
-            fig.tight_layout()
+    if stats.get("steps_saved"):
+        print(
+            f"Cooling stopped early, saving {stats['steps_saved']} of",
+            f"{stats.get('steps', 0) + stats['steps_saved']} Monte-Carlo "
+            "steps.",
+        )
 
-            svg = save_svg(fig)
+    if "swap_rates" in stats:
+        rates = (f"{rate:.2f}" for rate in stats["swap_rates"])
+        print("Tempering exchange rates:", ", ".join(rates))
 
-            debug_svg.append(svg)
+    if "clusters" in stats:
+        print(
+            f"Optimised {len(stats['clusters'])} clusters and refined",
+            f"{stats['refined']} houses near their borders.",
+        )
+
+    for i, r in enumerate(stats.get("replicas", [])):
+        print(
+            f"Replica {i}: energy {Decimal(r['energy']):.3E},",
+            f"biggest walk {r['max_dist']:.1f}, {r['time']:.1f}s",
+        )
+
+    print()
+
+    return result
+
+
+def formatter(prog):
+    return argparse.HelpFormatter(prog, max_help_position=52)
 
-        print("Total final energy is: ", f"{Decimal(energy):.2E}")
 
-    print("The biggest walk is:", max_dist)
-    print("Percentage loads:", ", ".join(str(tap[3]) for tap in taps))
+def main():
+    if sys.argv[1:2] == ["batch"]:
+        from .batch import batch
+
+        sys.exit(batch(sys.argv[2:]))
 
     # ****************************************************************************
-    # *                                 Make html                                *
+    # *                              Parse Arguments                             *
     # ****************************************************************************
 
-    for t in taps:
-        t[0], t[1], t[3] = *convert.enu2geo(t[0], t[1]), int(t[3])
-        t[0], t[1] = float(t[0]), float(t[1])
-
-    for h in houses:
-        h[0], h[1], h[3] = *convert.enu2geo(h[0], h[1]), int(h[3])
-        h[0], h[1] = float(h[0]), float(h[1])
+    parser = argparse.ArgumentParser(formatter_class=formatter)
+    group = parser.add_mutually_exclusive_group(required=True)
 
-    houses.sort(key=lambda x: x[2])
+    parser.add_argument("path", help="Path to house data.")  # positional
 
-    if args.csv:
-        with open(f"{path[:-4]}_taps.csv", "w") as f:
-            for t in taps:
-                print(f"{round(t[0], 5)},{round(t[1], 5)}", file=f)
+    parser.add_argument(
+        "-V", "--version", action="version", version="%(prog)s " + __version__
+    )
 
-    if args.kml:
-        kml = simplekml.Kml()
-        for t in taps:
-            # long, lat for simplekml!
-            kml.newpoint(name="Tap", coords=[(t[1], t[0])])
+    add_village_options(parser, group)
 
-        for h in houses:
-            kml.newpoint(name="House", coords=[(h[1], h[0])])
+    parser.add_argument(
+        "--csv", action="store_true", help="Write results to a .csv file."
+    )
+    parser.add_argument(
+        "--kml", action="store_true", help="Write results to a .kml file."
+    )
+    parser.add_argument(
+        "--no-debug", action="store_false", help="Disable debugging graphs."
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="Periodically save the run to a _checkpoint.npz file.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue the run saved by --checkpoint.",
+    )
+    parser.add_argument(
+        "--events",
+        action="store",
+        metavar="PATH",
+        help="Write the stages and every cooling step as JSON lines.",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store",
+        metavar="DIR",
+        help="Write a cProfile .prof file of every stage to DIR.",
+    )
+    parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Trace the peak memory of every stage (into --events).",
+    )
+    parser.add_argument(
+        "--report",
+        action="store",
+        choices=["auto", "full", "light"],
+        default="auto",
+        help="Light reports rasterise the plots, summarise the houses and "
+        "list them in a _houses.csv, auto picks light for large villages.",
+    )
+    parser.add_argument(
+        "-q",
+        "--quiet",
+        "--no-report",
+        action="store_true",
+        help="Print nothing and only write the taps .csv (and .kml).",
+    )
 
-        kml.save(f"{path[:-4]}_taps.kml")
+    args = parser.parse_args()
 
-    percentage = 50
-    raw_html = f"""
-    <!DOCTYPE html>
-    <html>
+    logger = logging.getLogger("taptimise")
+    logger.addHandler(Echo())
+    logger.setLevel(logging.INFO)
 
-    <head>
-    <title> Taptimise {name.upper()} Report </title>
-    </head>
+    if not args.quiet:
+        banner()
 
-    <style>
-    .center_svg {{
-        display: block;
-        margin-left: auto;
-        margin-right: auto;}}
+    if os.path.isabs(args.path):
+        path = os.path.normpath(args.path)
+    else:
+        path = os.path.abspath(args.path)
 
-    .center_txt {{
-        display: block;
-        margin-left: auto;
-        margin-right: auto;
-        width: 80vmin;}}
+    # ****************************************************************************
+    # *                             Run Optimisation                             *
+    # ****************************************************************************
 
-    h1{{font-size:50px;}}
-    h2{{font-size:40px;}}
-    p{{font-size:20px;}}
+    raw_houses, convert, bad_rows = load_village(path, args.scribble)
 
-    table {{
-            border-collapse: collapse;
-            width: 100%;}}
+    if args.quiet:
+        with open(os.devnull, "w") as null:
+            with redirect_stdout(null), redirect_stderr(null):
+                result = run(args, raw_houses)
+    else:
+        if bad_rows:
+            print(f"Skipped {bad_rows} unreadable rows.")
 
-    td, th {{
-            font-size:20px;
-            border: 1px solid #dddddd;
-            text-align: left;
-            padding: 8px;}}
+        result = run(args, raw_houses)
 
-    tr:nth-child(even) {{
-            background-color: #dddddd;}}
+    houses, taps, max_dist, run_data, energy, stats = result
 
-    table th {{
-        background-color: black;
-        color: white;}}
+    # ****************************************************************************
+    # *                                   Plot                                   *
+    # ****************************************************************************
 
-    </style>
+    name = os.path.basename(args.path)[:-4]
 
-    <body>
+    if args.report == "auto":
+        light = len(houses) > LIGHT_HOUSES
+    else:
+        light = args.report == "light"
 
-    <div class="center_txt">
+    if not args.quiet:
+        map_svg = plot_village(houses, taps, name, light)
 
-    <h1 align="center">Taptimise Report - Village: {name.upper()}</h1>
+        debug_svg = []
 
-    <p> This report has been generated using Taptimise the tap positioning
-        Monte-Carlo-Annealing optimiser. For more information and bug reporting
-        visit <a href="https://github.com/ConorWilliams/taptimise">GitHub</a>.
-        </p>
+        if args.no_debug:
+            debug_svg = plot_debug(run_data, len(houses), light)
 
-    <p> Copyright 2019 C. J. Williams (CHURCHILL COLLEGE). Taptimise is free
-        (open-source) software with ABSOLUTELY NO WARRANTY, distibuted under the
-        MIT license.
-        </p>
+            print("Total final energy is: ", f"{Decimal(energy):.2E}")
 
-    <p> The arguments & flags given to produce this report where:
-        "{' '.join(sys.argv[1:])}" running Taptimise version {__version__}.
-        </p>
+        print("The biggest walk is:", max_dist)
+        print("Percentage loads:", ", ".join(str(tap[3]) for tap in taps))
 
-    <p> Taptimise placed <b>{len(taps)} taps</b>. The furthest tap-house separation was
-        <b>{'{:g}'.format(float('{:.{p}g}'.format(max_dist, p=3)))} meters</b>.
-        The final energy of the village was <b>{Decimal(energy):.2E}
-        units </b>. A summery of the tap loads are:
-        {', '.join(str(tap[3]) for tap in taps)}. With a mean of
-        <b>{round(statistics.mean(t[3] for t in taps))} ±
-        {round(statistics.pstdev(t[3] for t in taps))}</b>.
-        </p>
+    # ****************************************************************************
+    # *                               Write Results                              *
+    # ****************************************************************************
 
-    <h2>Village Map</h2>
+    to_geo(taps, convert)
+    to_geo(houses, convert)
 
-    </div>
+    houses.sort(key=lambda x: x[2])
 
+    if args.csv or args.quiet:
+        write_taps(path[:-4], taps)
 
-    <div class="center_svg">
-    {map_svg}
-    </div>
+    if args.kml:
+        import simplekml
 
-    <div class="center_txt">
-    <h2>Annealing Data</h2>
-    </div>
+        kml = simplekml.Kml()
+        for t in taps:
+            # long, lat for simplekml!
+            kml.newpoint(name="Tap", coords=[(t[1], t[0])])
 
-    <div class="center_svg">
-    {''.join(debug_svg)}
-    </div>
+        for h in houses:
+            kml.newpoint(name="House", coords=[(h[1], h[0])])
 
-    <div class="center_txt">
-    <h2>Tap Data</h2>
-    {to_html(['Latitude', 'Longitude', 'Number', 'Load'], taps)}
-    <h2>House Data</h2>
-    {to_html(['Latitude', 'Longitude', 'Tap Number', 'Separation/m'], houses)}
-    </div>
+        kml.save(path[:-4] + TAPS_KML)
 
+    if args.quiet:
+        return
 
-    </body>
-    </html>"""
+    # ****************************************************************************
+    # *                                 Make html                                *
+    # ****************************************************************************
 
-    with open(f"{path[:-4]}_report.html", "w") as html:
-        html.write(raw_html)
+    write_report(path[:-4], name, result, map_svg, debug_svg, light)
@@ -3,8 +3,11 @@ import pymap3d as p3d
 
 class LocalXY():
     # Shallow wrapper to pymap3d's local tangent plane coordinate transforms.
-    # This is required to correct for the curvature of the Earth distorting 
-    # lat, long away from the equator.
+    # This is required to correct for the curvature of the Earth distorting
+    # lat, long away from the equator. Both transforms accept scalars or
+    # NumPy arrays, converting whole arrays in one call is much faster.
+
+    ELL = p3d.Ellipsoid('wgs84')
 
     def __init__(self, lat0, lon0):
         self.lat0 = lat0
@@ -12,12 +15,12 @@ class LocalXY():
 
     def geo2enu(self, lat, lon):
         x, y, _ = p3d.geodetic2enu(
-            lat, lon, 0, self.lat0, self.lon0, 0, deg=True, ell=p3d.Ellipsoid('wgs84'))
+            lat, lon, 0, self.lat0, self.lon0, 0, deg=True, ell=self.ELL)
 
         return x, y
 
     def enu2geo(self, x, y):
         lat, lon, _ = p3d.enu2geodetic(
-            x, y, 0, self.lat0, self.lon0, 0, deg=True, ell=p3d.Ellipsoid('wgs84'))
+            x, y, 0, self.lat0, self.lon0, 0, deg=True, ell=self.ELL)
 
         return lat, lon
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+
+import numpy as np
+
+from .classes import Tap, HouseSet, penalised
+
+ARRAY_MIN = 16  # taps with fewer houses are scored by the plain loop
+
+
+class HouseArrays:
+    # Contiguous struct-of-arrays copy of the (static) house data. Each house
+    # is tagged with its row so taps can gather their members by index.
+    def __init__(self, houses):
+        n = len(houses)
+
+        self.x = np.fromiter((h.pos.real for h in houses), float, n)
+        self.y = np.fromiter((h.pos.imag for h in houses), float, n)
+        self.demand = np.fromiter((h.demand for h in houses), float, n)
+        self.max_sq_dist = np.fromiter(
+            (h.max_sq_dist for h in houses), float, n
+        )
+
+        for i, h in enumerate(houses):
+            h.index = i
+
+
+class Members(HouseSet):
+    # HouseSet that mirrors the membership in a packed index array. The rows
+    # are kept in an array.array, which is cheap to update one at a time,
+    # and viewed as a NumPy array only when the tap is scored.
+    __slots__ = ("idx",)
+
+    def __init__(self):
+        super().__init__()
+        self.idx = array("q")
+
+    def add(self, house):
+        self.idx.append(house.index)
+        super().add(house)
+
+    def remove(self, house):
+        last = self.idx.pop()
+
+        if house.slot < len(self.idx):
+            self.idx[house.slot] = last
+
+        super().remove(house)
+
+    def indices(self):
+        return np.frombuffer(self.idx, dtype=np.int64)
+
+
+class ArrayTap(Tap):
+    # Drop in replacement for Tap that evaluates its bond-energies with NumPy
+    # over its members rows of a shared HouseArrays.
+    __slots__ = ("arrays",)
+
+    def __init__(self, exp_load, arrays, index=None):
+        super().__init__(exp_load, index)
+        self.arrays = arrays
+        self.houses = Members()
+
+    def bond_energy(self):
+        # below ARRAY_MIN houses gathering the rows costs more than it saves
+        if len(self.houses) < ARRAY_MIN:
+            return super().bond_energy()
+
+        idx = self.houses.indices()
+
+        a = self.arrays
+
+        dx = a.x[idx] - self.pos.real
+        dy = a.y[idx] - self.pos.imag
+
+        sqdist = dx * dx + dy * dy
+
+        if not Tap.SQUARED:
+            sqdist = np.sqrt(sqdist)
+
+        # penalise bonds longer than max walking distance
+        max_sq_dist = a.max_sq_dist[idx]
+        over = (max_sq_dist > 0) & (sqdist > max_sq_dist)
+
+        if over.any():
+            sqdist[over] = penalised(sqdist[over], max_sq_dist[over])
+
+        return float(np.dot(sqdist, a.demand[idx]))
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+
+"""Regression tests of the taptimise command line."""
+
+import os
+import shutil
+import sys
+
+from taptimise.taptimise import main
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_cli(monkeypatch, *argv):
+    monkeypatch.setattr(sys, "argv", ["taptimise", *argv])
+    main()
+
+
+def test_one_tap_village(tmp_path, monkeypatch):
+    path = str(tmp_path / "e3.csv")
+    shutil.copy(os.path.join(HERE, "e3.csv"), path)
+
+    for options in (["-t", "3000"], ["-N", "1"]):
+        run_cli(monkeypatch, path, "-s", "5", "-q", *options)
+
+        with open(str(tmp_path / "e3_taps.csv")) as f:
+            assert len(f.read().splitlines()) == 1
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+
+"""Regression tests of taptimise.optimise on the bundled villages."""
+
+import os
+
+from taptimise.ingest import load_village
+from taptimise.optimise import optimise, fewest_taps
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def village(name):
+    houses, _, _ = load_village(os.path.join(HERE, name))
+    return houses
+
+
+def test_fewest_taps_reruns_from_reported_seed():
+    houses = village("e1.csv")
+
+    for search in ("linear", "gallop"):
+        first = fewest_taps(houses, 1000, 120, search=search, steps=3)
+        again = fewest_taps(
+            houses, 1000, 120, search=search, steps=3, seed=first.stats["seed"]
+        )
+
+        assert again.taps == first.taps
+        assert again.houses == first.houses
+
+
+def test_one_tap_saves_no_steps():
+    for schedule in ("geometric", "adaptive"):
+        result = optimise(
+            village("e3.csv"), 3000, steps=5, schedule=schedule, seed=1
+        )
+
+        assert len(result.taps) == 1
+        assert result.stats["steps"] == 0
+        assert "steps_saved" not in result.stats